@@ -0,0 +1,188 @@
+# answer_cache.py
+
+from langchain_core.runnables import Runnable
+from metrics_utils import span
+from lexical_index import share_query_vector, reset_query_vector
+from cache_utils import text_hash
+from collections import OrderedDict
+import numpy as np
+import threading
+import itertools
+import time
+import os
+
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("MIRAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("MIRAG_ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("MIRAG_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
+
+class SemanticAnswerCache:
+    # (index identity, question embedding) -> answer. A lookup hits when a
+    # stored question for the same index has cosine similarity >= threshold.
+    # Entries expire after `ttl_seconds` and are evicted least recently used.
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()      # entry id -> (index_id, vector, answer, created, latency)
+        self._by_index = {}                # index_id -> set of entry ids
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, entry_id):
+        index_id = self._entries.pop(entry_id)[0]
+        ids = self._by_index.get(index_id)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_index[index_id]
+
+    def lookup(self, index_id: str, vector):
+        start = time.perf_counter()
+        vector = self._normalize(vector)
+        now = time.time()
+
+        with self._lock:
+            ids = list(self._by_index.get(index_id, ()))
+            expired = [i for i in ids if now - self._entries[i][3] > self.ttl_seconds]
+            for entry_id in expired:
+                self._drop(entry_id)
+            ids = [i for i in ids if i in self._entries]
+
+            if ids:
+                matrix = np.stack([self._entries[i][1] for i in ids])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    _, _, answer, _, latency = self._entries[entry_id]
+                    self.hits += 1
+                    self.saved_seconds += max(0.0, latency - (time.perf_counter() - start))
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def store(self, index_id: str, vector, answer: str, latency: float):
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (index_id, self._normalize(vector), answer, time.time(), latency)
+            self._by_index.setdefault(index_id, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "entries": len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_index.clear()
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache()
+        return _answer_cache
+
+
+class SemanticCachedChain(Runnable):
+    # Wraps a QA chain that takes {"question", "query", "memory"}: the user's
+    # question, the query used for retrieval and the conversation memory for
+    # the prompt. Input is either the question itself or such a dict (see
+    # memory_utils.ConversationMemory.inputs). The memory is part of the
+    # prompt, so a question asked with memory is cached under the index and
+    # a hash of that memory: it only hits for the same conversation, never
+    # another session's. A follow-up that needed rewriting bypasses the cache.
+    # `index_id` may be a callable for indexes whose content still changes.
+
+    def __init__(self, chain, index_id: str, embeddings, cache: SemanticAnswerCache = None):
+        self.chain = chain
+        self.index_id = index_id
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else get_answer_cache()
+
+    @staticmethod
+    def _split_input(input):
+        if isinstance(input, dict):
+            question = input["question"]
+            query = input.get("query") or question
+            return question, {"question": question, "query": query, "memory": input.get("memory") or ""}, query != question
+        return input, {"question": input, "query": input, "memory": ""}, False
+
+    def invoke(self, input, config=None, **kwargs):
+        return "".join(self.stream(input, config, **kwargs))
+
+    def stream(self, input, config=None, **kwargs):
+        question, chain_input, is_follow_up = self._split_input(input)
+
+        if is_follow_up:
+            self.cache.record_bypass()
+            yield from self.chain.stream(chain_input, config, **kwargs)
+            return
+
+        with span("answer_cache.lookup") as s:
+            index_id = self.index_id() if callable(self.index_id) else self.index_id
+            if chain_input["memory"]:
+                index_id = f"{index_id}\x00memory:{text_hash(chain_input['memory'])}"
+            vector = self.embeddings.embed_query(question)
+            answer = self.cache.lookup(index_id, vector)
+            s.set(cache_hit=answer is not None)
+        if answer is not None:
+            yield answer
+            return
+
+        # Retrieval for the same text reuses this vector instead of embedding it again
+        start = time.perf_counter()
+        parts = []
+        token = share_query_vector(self.embeddings, question, vector)
+        try:
+            for chunk in self.chain.stream(chain_input, config, **kwargs):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            reset_query_vector(token)
+        self.cache.store(index_id, vector, "".join(parts), time.perf_counter() - start)
+
+
+def answer_cache_stats():
+    return get_answer_cache().stats()
@@ -2,20 +2,22 @@
 
 import streamlit as st
 from datetime import datetime
+import uuid
 
 from rag_utils import (
     create_vectorstore_from_url,
+    create_vectorstore_from_urls,
     build_qa_chain,
     build_summary_chain,
     generate_chat_pdf_buffer,
-    create_vectorstore_from_text
+    create_vectorstore_from_text,
+    new_conversation_memory,
+    build_collection_qa_chain
 )
-from pdf_utils import (
-    process_pdf,
-    build_pdf_qa_chain,
-    build_pdf_summary_chain
-)
-from youtube_utils import process_youtube_video
+from session_manager import get_resource_manager
+from cache_utils import embedding_cache_stats
+from metrics_utils import timed_stream, all_metrics, collect_traces, trace_spans
+from answer_cache import answer_cache_stats
 
 
 # --- App Configuration ---
@@ -35,20 +37,37 @@ st.markdown(
 )
 
 # Initialize session state
-for key in [
-    "vectorstore", "chain", "history", "raw_docs", "max_memory",
-    "pdf_chain", "pdf_history", "pdf_docs"
-]:
+# Indexes, chains and loaded documents live in the server-wide resource
+# manager (shared between sessions, within a memory budget), not in here
+for key in ["history", "pdf_history", "pdf_job"]:
     if key not in st.session_state:
-        st.session_state[key] = [] if "history" in key or "docs" in key else None
-st.session_state.max_memory = 3
+        st.session_state[key] = [] if "history" in key else None
+
+
+# Traces finished during this script run, for this session's debug panel
+run_traces = []
+collect_traces(run_traces)
+
 
+def chat_memory(name: str, reset: bool = False):
+    # Token-bounded conversation memory, one per tab and session
+    key = f"{name}_memory"
+    if reset or st.session_state.get(key) is None:
+        st.session_state[key] = new_conversation_memory()
+    return st.session_state[key]
+
+
+def session_resources():
+    # This browser session's share of the resource manager
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return get_resource_manager().session(st.session_state.session_id)
 
 
 # ---------------------------------------------------------------------
 page = st.selectbox(
     label="Select a data source for Retrieval-Augmented Question Answering:",
-    options=["Custom Text QA", "Web QA", "PDF QA", "YouTube QA"],
+    options=["Custom Text QA", "Web QA", "PDF QA", "YouTube QA", "All Sources QA"],
     index=0,
     format_func=lambda x: x,  # Keep proper case for readability
 )
@@ -63,6 +82,7 @@ if page == "Custom Text QA":
         try:
             st.session_state.default_manual_chain = build_qa_chain(None)
             st.session_state.manual_history = []
+            chat_memory("manual", reset=True)
         except Exception as e:
             st.error(f"Failed to initialize chatbot: {e}")
 
@@ -84,17 +104,20 @@ if page == "Custom Text QA":
                     try:
                         if manual_text.strip():
                             vs = create_vectorstore_from_text(manual_text)
-                            st.session_state.manual_chain = build_qa_chain(vs)
+                            key = session_resources().use_index("manual", vs, build_qa_chain)
+                            session_resources().add_source(vs, "text", "custom text", key=key)
                             st.success("Custom text processed and QA chain created.")
                         else:
-                            st.session_state.manual_chain = st.session_state.default_manual_chain
+                            session_resources().release("manual")
                             st.info("No text provided. Using default chatbot.")
                         st.session_state.manual_history = []
+                        chat_memory("manual", reset=True)
                     except Exception as e:
                         st.error(f"Failed to process text: {e}")
 
     # Use the appropriate QA chain
-    current_chain = st.session_state.get("manual_chain") or st.session_state.get("default_manual_chain")
+    sess = session_resources()
+    current_chain = sess.chain("manual") if sess.has("manual") else st.session_state.get("default_manual_chain")
 
     if current_chain:
         st.subheader("Ask a Question")
@@ -103,12 +126,14 @@ if page == "Custom Text QA":
         if st.button("Get Answer", key="manual_a") and manual_q:
             with st.spinner("Generating answer..."):
                 try:
-                    memory_context = "\n\n".join(
-                        [f"Q: {q}\nA: {a}" for q, a in st.session_state.manual_history[-st.session_state.max_memory:]]
-                    )
-                    full_q = f"{memory_context}\n\n{manual_q}" if memory_context else manual_q
-                    answer = current_chain.invoke(full_q)
+                    memory = chat_memory("manual")
+                    chain_input = memory.inputs(manual_q)
+                    answer_box = st.empty()
+                    with answer_box.container():
+                        answer = st.write_stream(timed_stream(current_chain.stream(chain_input), "manual_qa"))
+                    answer_box.empty()
                     st.session_state.manual_history.append((manual_q, answer))
+                    memory.add_turn(manual_q, answer)
                 except Exception as e:
                     st.error(f"Error: {e}")
 
@@ -139,38 +164,55 @@ if page == "Custom Text QA":
 
 # --- 🌐 Web URL QA Tab ---
 elif page == "Web QA":
+    # Tab-specific loaders are imported on first use, not at startup
+    from crawl_utils import is_sitemap_url
+
     st.header("Web-Based RAG Question Answering")
 
     with st.form("url_form"):
-        url = st.text_input("Enter URL to analyze", placeholder="https://...")
+        url = st.text_area(
+            "Enter URL(s) to analyze",
+            placeholder="https://...\nOne URL per line, or a sitemap.xml URL",
+            height=100
+        )
         use_selenium = st.checkbox("Use Selenium Loader (for javascript-heavy pages)", value=False)
         submitted = st.form_submit_button("Load URL and Build Vectorstore")
 
-        if submitted and url:
+        urls = [u.strip() for u in url.splitlines() if u.strip()]
+        if submitted and urls:
             with st.spinner("Loading content and building vectorstore..."):
                 try:
-                    vs, docs = create_vectorstore_from_url(url, use_selenium)
-                    st.session_state.vectorstore = vs
-                    st.session_state.chain = build_qa_chain(vs)
-                    st.session_state.raw_docs = docs
+                    if len(urls) == 1 and not is_sitemap_url(urls[0]):
+                        vs, docs = create_vectorstore_from_url(urls[0], use_selenium)
+                    else:
+                        vs, docs, errors = create_vectorstore_from_urls(urls, use_selenium)
+                        for failed_url, error in errors.items():
+                            st.warning(f"Skipped {failed_url}: {error}")
+                    key = session_resources().use_index("web", vs, build_qa_chain)
+                    session_resources().add_source(vs, "web", key=key)
+                    session_resources().set_documents("web", docs)
                     st.session_state.history = []
+                    chat_memory("web", reset=True)
                     st.success("Vectorstore successfully created.")
                 except Exception as e:
                     st.error(f"Failed to process URL: {e}")
 
-    if st.session_state.vectorstore and st.session_state.chain:
+    sess = session_resources()
+    if sess.has("web"):
         st.subheader("Ask a Question")
         question = st.text_input("Your Question", key="web_q")
 
         if st.button("Get Answer", key="web_a") and question:
             with st.spinner("Thinking..."):
                 try:
-                    memory_context = "\n\n".join(
-                        [f"Q: {q}\nA: {a}" for q, a in st.session_state.history[-st.session_state.max_memory:]]
-                    )
-                    full_query = f"{memory_context}\n\n{question}" if memory_context else question
-                    answer = st.session_state.chain.invoke(full_query)
+                    memory = chat_memory("web")
+                    chain_input = memory.inputs(question)
+                    answer_box = st.empty()
+                    with answer_box.container():
+                        answer = st.write_stream(timed_stream(sess.chain("web").stream(chain_input), "web_qa"))
+                    answer_box.empty()
                     st.session_state.history.append((question, answer))
+                    memory.add_turn(question, answer)
                 except Exception as e:
                     st.error(f"Error: {e}")
 
@@ -183,11 +225,10 @@ elif page == "Web QA":
         if st.button("Summarize Page"):
             with st.spinner("Summarizing..."):
                 try:
-                    docs_text = "\n\n".join(doc.page_content for doc in st.session_state.raw_docs)
+                    docs_text = sess.text("web")
                     summary_chain = build_summary_chain()
-                    summary = summary_chain.invoke({"context": docs_text})
                     st.markdown("### Summary")
-                    st.markdown(summary)
+                    st.write_stream(timed_stream(summary_chain.stream({"context": docs_text}), "web_summary"))
                 except Exception as e:
                     st.error(f"Error generating summary: {e}")
     else:
@@ -195,33 +236,66 @@ elif page == "Web QA":
 
 # --- 📄 PDF QA Tab ---
 elif page == "PDF QA":
+    from pdf_utils import file_content_hash, ingest_pdf, build_pdf_summary_chain, build_pdf_index_qa_chain
+
     st.header("PDF-Based QA & Summarization")
 
     pdf_file = st.file_uploader("Upload PDF", type=["pdf"])
     if pdf_file:
-        with st.spinner("Processing PDF..."):
-            try:
-                pdf_text, pdf_docs = process_pdf(pdf_file)
-                st.session_state.pdf_chain = build_pdf_qa_chain(pdf_docs)
-                st.session_state.pdf_docs = pdf_docs
-                st.session_state.pdf_history = []
-                st.success("PDF processed successfully.")
-            except Exception as e:
-                st.error(f"Failed to process PDF: {e}")
+        pdf_bytes = pdf_file.getvalue()
+        pdf_hash = file_content_hash(pdf_bytes)
 
-    if st.session_state.get("pdf_chain"):
+        # Only (re)build when a different document is uploaded, not on every rerun
+        if st.session_state.get("pdf_hash") != pdf_hash:
+            with st.spinner("Processing PDF..."):
+                try:
+                    pdf_job = ingest_pdf(pdf_bytes, pdf_hash, pdf_file.name)
+                    pdf_job.wait_until_queryable()
+                    session_resources().release("pdf")
+                    st.session_state.pdf_job = pdf_job
+                    st.session_state.pdf_history = []
+                    chat_memory("pdf", reset=True)
+                    st.session_state.pdf_hash = pdf_hash
+                    st.success("PDF processed successfully.")
+                except Exception as e:
+                    st.error(f"Failed to process PDF: {e}")
+
+        # Large PDFs keep indexing in the background; answers use the pages indexed so far
+        pdf_job = st.session_state.get("pdf_job")
+        if pdf_job and not pdf_job.done:
+            if pdf_job.error is not None:
+                st.error(f"PDF indexing stopped at page {pdf_job.pages_done}: {pdf_job.error}")
+            else:
+                st.progress(
+                    pdf_job.pages_done / max(pdf_job.total_pages, 1),
+                    text=f"Indexed {pdf_job.pages_done}/{pdf_job.total_pages} pages..."
+                )
+        elif pdf_job and st.session_state.get("pdf_collected") != pdf_job.key:
+            # Fully indexed and stored: hand it to the resource manager, which
+            # shares it with other sessions and may map it back from disk later
+            vs = pdf_job.vectorstore
+            session_resources().use_index("pdf", vs, build_pdf_index_qa_chain, key=pdf_job.key)
+            session_resources().add_source(vs, "pdf", pdf_job.file_name, key=pdf_job.key)
+            st.session_state.pdf_collected = pdf_job.key
+
+    sess = session_resources()
+    pdf_job = st.session_state.get("pdf_job")
+    pdf_chain = sess.chain("pdf") if sess.has("pdf") else pdf_job.chain if pdf_job else None
+    if pdf_chain:
         st.subheader("Ask a Question About PDF")
         pdf_q = st.text_input("Your PDF Question", key="pdf_q")
 
         if st.button("Get PDF Answer", key="pdf_a") and pdf_q:
             with st.spinner("Thinking..."):
                 try:
-                    memory_context = "\n\n".join(
-                        [f"Q: {q}\nA: {a}" for q, a in st.session_state.pdf_history[-st.session_state.max_memory:]]
-                    )
-                    full_q = f"{memory_context}\n\n{pdf_q}" if memory_context else pdf_q
-                    answer = st.session_state.pdf_chain.invoke(full_q)
+                    memory = chat_memory("pdf")
+                    chain_input = memory.inputs(pdf_q)
+                    answer_box = st.empty()
+                    with answer_box.container():
+                        answer = st.write_stream(timed_stream(pdf_chain.stream(chain_input), "pdf_qa"))
+                    answer_box.empty()
                     st.session_state.pdf_history.append((pdf_q, answer))
+                    memory.add_turn(pdf_q, answer)
                 except Exception as e:
                     st.error(f"Error: {e}")
 
@@ -256,10 +330,11 @@ elif page == "PDF QA":
         if st.button("Summarize PDF"):
             with st.spinner("Summarizing PDF..."):
                 try:
-                    full_pdf = "\n\n".join(doc.page_content for doc in st.session_state.pdf_docs)
-                    summary = build_pdf_summary_chain().invoke({"context": full_pdf})
+                    # Read from the manager's copy once this session holds the finished index
+                    pdf_vs = sess.vectorstore("pdf") if sess.has("pdf") else None
+                    full_pdf = "\n\n".join(doc.page_content for doc in pdf_job.documents(pdf_vs))
                     st.markdown("### Summary")
-                    st.markdown(summary)
+                    st.write_stream(timed_stream(build_pdf_summary_chain().stream({"context": full_pdf}), "pdf_summary"))
                 except Exception as e:
                     st.error(f"Error generating summary: {e}")
     else:
@@ -267,6 +342,9 @@ elif page == "PDF QA":
 
 # --- 📺 YouTube QA Tab ---
 elif page == "YouTube QA":
+    from youtube_utils import process_youtube_video, extract_video_id, link_timestamps
+    from rag_utils import youtube_prompt
+
     st.header("YouTube Video QA & Summarization")
 
     yt_url = st.text_input("Enter YouTube Video URL")
@@ -275,31 +353,39 @@ elif page == "YouTube QA":
         with st.spinner("Fetching and processing transcript..."):
             try:
                 vs, yt_docs = process_youtube_video(yt_url)
-                st.session_state.yt_chain = build_qa_chain(vs)
-                st.session_state.yt_docs = yt_docs
+                key = session_resources().use_index("yt", vs, lambda vs: build_qa_chain(vs, youtube_prompt))
+                session_resources().add_source(vs, "youtube", key=key)
+                session_resources().set_documents("yt", yt_docs)
+                st.session_state.yt_video_id = extract_video_id(yt_url)
                 st.session_state.yt_history = []
+                chat_memory("yt", reset=True)
                 st.success("Transcript loaded and vectorstore created.")
             except Exception as e:
                 st.error(f"❌ Failed to process video: {e}")
 
-    if st.session_state.get("yt_chain"):
+    sess = session_resources()
+    if sess.has("yt"):
         st.subheader("Ask a Question About Video")
         yt_q = st.text_input("Your Question", key="yt_q")
 
         if st.button("Get Answer", key="yt_a") and yt_q:
             with st.spinner("Thinking..."):
                 try:
-                    memory_context = "\n\n".join([f"Q: {q}\nA: {a}"
-                                                  for q, a in st.session_state.yt_history[-st.session_state.max_memory:]])
-                    full_q = f"{memory_context}\n\n{yt_q}" if memory_context else yt_q
-                    answer = st.session_state.yt_chain.invoke(full_q)
+                    memory = chat_memory("yt")
+                    chain_input = memory.inputs(yt_q)
+                    answer_box = st.empty()
+                    with answer_box.container():
+                        answer = st.write_stream(timed_stream(sess.chain("yt").stream(chain_input), "yt_qa"))
+                    answer_box.empty()
                     st.session_state.yt_history.append((yt_q, answer))
+                    memory.add_turn(yt_q, answer)
                 except Exception as e:
                     st.error(f"Error: {e}")
 
         for q, a in st.session_state.yt_history[::-1]:
             st.markdown(f"**Q:** {q}")
-            st.markdown(f"**A:** {a}")
+            # [mm:ss] citations link to that moment in the video
+            st.markdown(f"**A:** {link_timestamps(a, st.session_state.yt_video_id)}")
             st.markdown("---")
         # --- Download YouTube Chat History Button ---
         if st.session_state.get("yt_history"):
@@ -324,13 +410,122 @@ elif page == "YouTube QA":
         if st.button("Summarize Video"):
             with st.spinner("Summarizing..."):
                 try:
-                    full_text = "\n\n".join(doc.page_content for doc in st.session_state.yt_docs)
-                    summary = build_summary_chain().invoke({"context": full_text})
+                    full_text = sess.text("yt")
                     st.markdown("### Summary")
-                    st.markdown(summary)
+                    st.write_stream(timed_stream(build_summary_chain().stream({"context": full_text}), "yt_summary"))
                 except Exception as e:
                     st.error(f"Error generating summary: {e}")
 
+# ---------------------------------------------------------------------
+# --- 🗂️ All Sources QA Tab ---
+elif page == "All Sources QA":
+    st.header("Ask Across All Loaded Sources")
+
+    # Every source loaded in any tab also lands in the session's collection
+    sess = session_resources()
+    sources = sess.list_sources()
+    if not sources:
+        st.info("Load a text, web page, PDF or video in the other tabs first.")
+    else:
+        col_types, col_sources = st.columns(2)
+        types = col_types.multiselect("Source types", sorted({s["type"] for s in sources}))
+        picked = col_sources.multiselect(
+            "Sources", [s["source_id"] for s in sources if not types or s["type"] in types]
+        )
+        all_q = st.text_input("Your Question", key="all_q")
+
+        if st.button("Get Answer", key="all_a") and all_q:
+            with st.spinner("Thinking..."):
+                try:
+                    chain = build_collection_qa_chain(sess.collection, sources=picked or None, types=types or None)
+                    memory = chat_memory("all")
+                    chain_input = memory.inputs(all_q)
+                    answer_box = st.empty()
+                    with answer_box.container():
+                        answer = st.write_stream(timed_stream(chain.stream(chain_input), "all_qa"))
+                    answer_box.empty()
+                    st.session_state.setdefault("all_history", []).append((all_q, answer))
+                    memory.add_turn(all_q, answer)
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        for q, a in st.session_state.get("all_history", [])[::-1]:
+            st.markdown(f"**Q:** {q}")
+            st.markdown(f"**A:** {a}")
+            st.markdown("---")
+
+# ---------------------------------------------------------------------
+# Sidebar panels come after the page body so they include this run's work
+# --- Sidebar: sources in the shared collection ---
+with st.sidebar.expander("Loaded Sources"):
+    sources = session_resources().list_sources()
+    if not sources:
+        st.caption("Nothing loaded yet.")
+    for source in sources:
+        col_name, col_remove = st.columns([4, 1])
+        col_name.caption(f"[{source['type']}] {source['source_id']} ({source['chunks']} chunks)")
+        if col_remove.button("✕", key=f"remove_{source['source_id']}"):
+            session_resources().remove_source(source["source_id"])
+            st.rerun()
+
+# --- Sidebar: embedding cache statistics ---
+with st.sidebar.expander("Embedding Cache"):
+    cache_stats = embedding_cache_stats()
+    st.caption(
+        f"Hits: {cache_stats['hits']} | Misses: {cache_stats['misses']} | "
+        f"Hit rate: {cache_stats['hit_rate']:.0%} | "
+        f"Entries: {cache_stats['entries']}/{cache_stats['max_entries']}"
+    )
+
+# --- Sidebar: semantic answer cache ---
+with st.sidebar.expander("Answer Cache"):
+    answer_stats = answer_cache_stats()
+    st.caption(
+        f"Hits: {answer_stats['hits']} | Misses: {answer_stats['misses']} | "
+        f"Bypassed: {answer_stats['bypassed']} | Hit rate: {answer_stats['hit_rate']:.0%} | "
+        f"Latency saved: {answer_stats['saved_seconds']:.1f}s"
+    )
+
+# --- Sidebar: perceived latency of streamed answers ---
+with st.sidebar.expander("Time to First Token"):
+    for name, stats in all_metrics().items():
+        if name.endswith(".ttft_seconds"):
+            st.caption(
+                f"{name.split('.')[0]}: p50 {stats['p50']:.2f}s | "
+                f"p95 {stats['p95']:.2f}s | n={stats['count']}"
+            )
+
+# --- Sidebar: estimated memory held for this session and the whole server ---
+with st.sidebar.expander("Memory Usage"):
+    usage = get_resource_manager().usage()
+    mine = next((s for s in usage["sessions"] if s["session_id"] == st.session_state.get("session_id")), None)
+    if mine:
+        st.caption(
+            f"This session: {(mine['index_bytes'] + mine['text_bytes'] + mine['collection_bytes']) / 1e6:.1f} MB "
+            f"({mine['indexes']} indexes)"
+        )
+    st.caption(
+        f"Server: {usage['total_bytes'] / 1e6:.1f}/{usage['budget_bytes'] / 1e6:.0f} MB | "
+        f"Sessions: {len(usage['sessions'])} | Indexes: {sum(i['loaded'] for i in usage['indexes'])}/{len(usage['indexes'])} loaded | "
+        f"Evictions: {usage['evictions']} | Reloads: {usage['reloads']}"
+    )
+
+# --- Sidebar: stage breakdown of the last completed request ---
+with st.sidebar.expander("Debug: Last Request"):
+    if run_traces:
+        st.session_state.last_trace_id = run_traces[-1]
+    spans = trace_spans(st.session_state.get("last_trace_id"))
+    if not spans:
+        st.caption("No request traced yet.")
+    depth = {}
+    for s in spans:
+        depth[s["span_id"]] = depth.get(s["parent_id"], -1) + 1
+        details = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in s["attributes"].items())
+        st.caption(
+            f"{'· ' * depth[s['span_id']]}{s['name']}: {s['duration_seconds'] * 1000:.0f} ms"
+            + (f" ({details})" if details else "") + (" ⚠" if s["error"] else "")
+        )
+
 # --- Footer ---
 st.markdown("---")
 st.markdown(
@@ -0,0 +1,71 @@
+# benchmarks/bench_chunking.py
+#
+# Splitting throughput and resulting index size per chunking strategy, on a
+# multi-MB structured document (headings + paragraphs) and on the same text
+# flattened to one line, which is the worst case for recursive splitting.
+# The old fixed 500-char splitter is included as the baseline.
+#
+#   python benchmarks/bench_chunking.py --paragraphs 20000 --dim 768
+
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from fixtures import synthetic_paragraphs
+from chunking import CHUNKERS, get_splitter
+
+
+def structured_text(paragraphs):
+    parts = []
+    for i, p in enumerate(paragraphs):
+        if i % 50 == 0:
+            parts.append(f"# Chapter {i // 50}")
+        elif i % 10 == 0:
+            parts.append(f"## Part {i // 10}")
+        parts.append(p)
+    return "\n\n".join(parts)
+
+
+def index_megabytes(chunks: int, dim: int) -> float:
+    # Flat L2 index, as built for every source
+    index = faiss.IndexFlatL2(dim)
+    index.add(np.zeros((chunks, dim), dtype=np.float32))
+    return faiss.serialize_index(index).nbytes / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragraphs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per embedding call")
+    args = parser.parse_args()
+
+    text = structured_text(synthetic_paragraphs(args.paragraphs))
+    inputs = {"structured": text, "one line": text.replace("\n", " ")}
+    splitters = {"baseline 500c": RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)}
+    splitters.update((name, get_splitter("web", name)) for name in CHUNKERS)
+
+    print(f"input {len(text) / 1e6:.1f} MB")
+    print(f"{'input':<11} {'strategy':<14} {'seconds':>8} {'MB/s':>6} {'chunks':>7} {'chunks/s':>9} {'avg tok':>8} {'embed calls':>12} {'index MB':>9}")
+    for input_name, data in inputs.items():
+        for name, splitter in splitters.items():
+            start = time.perf_counter()
+            chunks = splitter.split_text(data)
+            elapsed = time.perf_counter() - start
+            avg_tokens = sum(len(c) for c in chunks) / len(chunks) / 4
+            calls = -(-len(chunks) // args.batch_size)
+            print(
+                f"{input_name:<11} {name:<14} {elapsed:>8.2f} {len(data) / 1e6 / elapsed:>6.0f} {len(chunks):>7} "
+                f"{len(chunks) / elapsed:>9.0f} {avg_tokens:>8.0f} {calls:>12} {index_megabytes(len(chunks), args.dim):>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_collection.py
+#
+# Add/remove cost and hybrid retrieval latency of a Collection holding
+# hundreds of sources, unfiltered and filtered by source type / source.
+# --shared gives each source its own index (as the tabs do) and adds it by
+# reference instead of embedding the chunks into the collection. Exits
+# non-zero when a retrieval p50 is over --target-ms.
+#
+#   python benchmarks/bench_collection.py --sources 300 --chunks 100 --dim 768 [--shared]
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from fixtures import synthetic_paragraphs
+from fake_backends import HashEmbeddings
+from collection import Collection, SOURCE_TYPES
+
+
+def timed(fn, runs: int):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sources", type=int, default=300)
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--shared", action="store_true")
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    embeddings = HashEmbeddings(size=args.dim)
+    collection = Collection(embeddings)
+    paragraphs = synthetic_paragraphs(args.chunks * 4, words_per_paragraph=60)
+    rng = random.Random(0)
+
+    start = time.perf_counter()
+    for s in range(args.sources):
+        docs = [Document(page_content=f"Source {s}. {p}") for p in rng.sample(paragraphs, args.chunks)]
+        if args.shared:
+            from langchain_community.vectorstores import FAISS
+            vs = FAISS.from_documents(docs, embeddings)
+            collection.add_vectorstore(vs, SOURCE_TYPES[s % len(SOURCE_TYPES)], f"source-{s}")
+        else:
+            collection.add_documents(f"source-{s}", SOURCE_TYPES[s % len(SOURCE_TYPES)], docs)
+    add_seconds = time.perf_counter() - start
+    print(f"added {args.sources} sources / {len(collection)} chunks in {add_seconds:.1f}s")
+
+    remove_ms, _ = timed(lambda: collection.remove_source(f"source-{rng.randrange(args.sources)}"), 20)
+    print(f"remove one source: p50 {remove_ms:.1f} ms")
+
+    questions = [f"what about cache latency in section {i}" for i in range(args.queries)]
+    cases = {
+        "all sources": collection.retriever(k=12),
+        "one type": collection.retriever(k=12, types=["pdf"]),
+        "five sources": collection.retriever(k=12, sources=[f"source-{i}" for i in range(1, 6)]),
+    }
+    print(f"{'filter':<13} {'p50 ms':>7} {'p95 ms':>7}")
+    slow = []
+    for name, retriever in cases.items():
+        it = iter(questions * 2)
+        retriever.invoke(questions[0])
+        p50, p95 = timed(lambda: retriever.invoke(next(it)), args.queries)
+        print(f"{name:<13} {p50:>7.1f} {p95:>7.1f}")
+        if p50 > args.target_ms:
+            slow.append(name)
+
+    if slow:
+        print(f"Over the {args.target_ms:.0f} ms target: {', '.join(slow)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# benchmarks/bench_crawl.py
+#
+# Offline benchmark of the concurrent crawl-and-index pipeline against a
+# local HTTP fixture site and a fake embedding backend with fixed latency.
+#
+#   python benchmarks/bench_crawl.py --pages 50 --concurrency 8
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MIRAG_CACHE_DIR", tempfile.mkdtemp(prefix="mirag-bench-"))
+
+from fixtures import FixtureServer, write_html_site
+from fake_backends import HashEmbeddings
+from crawl_utils import crawl_and_index_sync
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with FixtureServer() as server:
+        paths = write_html_site(server.directory, args.pages)
+        sitemap = server.write_sitemap(paths)
+
+        for concurrency in sorted({1, args.concurrency}):
+            embeddings = HashEmbeddings(latency=args.embed_latency)
+            start = time.perf_counter()
+            vectorstore, docs, errors = crawl_and_index_sync([sitemap], embeddings, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print(
+                f"concurrency={concurrency:>3}  pages={len(docs):>4}  chunks={vectorstore.index.ntotal:>6}  "
+                f"embed_calls={embeddings.calls:>4}  errors={len(errors)}  {elapsed:.2f}s  "
+                f"({len(docs) / elapsed:.1f} pages/s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
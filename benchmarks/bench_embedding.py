@@ -0,0 +1,92 @@
+# benchmarks/bench_embedding.py
+#
+# Compares a plain sequential embedding call against the batched,
+# rate-limited executor using a local fake embedder with per-call latency
+# and injected 429 errors, then shows checkpoint/resume through the cache.
+#
+#   python benchmarks/bench_embedding.py --chunks 2000 --latency 0.1
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_backends import HashEmbeddings
+from embedding_executor import BatchedEmbeddings, TokenBucket
+from cache_utils import CachedEmbeddings, EmbeddingCache
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+class FlakyEmbeddings(HashEmbeddings):
+    # Fails a fraction of calls with a 429, and optionally dies for good after N calls
+    def __init__(self, failure_rate=0.0, fail_after=None, **kwargs):
+        super().__init__(**kwargs)
+        self.failure_rate = failure_rate
+        self.fail_after = fail_after
+        self._rng = random.Random(0)
+
+    def embed_documents(self, texts):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise RuntimeError("connection reset")
+        if self._rng.random() < self.failure_rate:
+            self.calls += 1
+            raise RateLimitError("429 Resource has been exhausted")
+        return super().embed_documents(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " + " ".join(str(i * j) for j in range(40)) for i in range(args.chunks)]
+
+    # Baseline: one request per small batch, sequential, no retries
+    baseline = HashEmbeddings(latency=args.latency)
+    start = time.perf_counter()
+    for i in range(0, len(texts), 20):
+        baseline.embed_documents(texts[i:i + 20])
+    print(f"sequential (batch=20)        {time.perf_counter() - start:6.2f}s  requests={baseline.calls}")
+
+    flaky = FlakyEmbeddings(failure_rate=args.failure_rate, latency=args.latency)
+    executor = BatchedEmbeddings(
+        flaky, batch_size=args.batch_size, max_concurrency=args.concurrency,
+        limiter=TokenBucket(rate=50, capacity=args.concurrency), base_delay=0.05,
+    )
+    start = time.perf_counter()
+    executor.embed_documents(texts)
+    print(
+        f"batched x{args.concurrency} (batch={args.batch_size})     {time.perf_counter() - start:6.2f}s  "
+        f"requests={executor.requests} retries={executor.retries}"
+    )
+
+    # Resume: the first attempt dies part-way, the second only embeds what is left
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "cache.sqlite3"))
+        dying = FlakyEmbeddings(fail_after=len(texts) // args.batch_size // 2, latency=args.latency)
+        cached = CachedEmbeddings(BatchedEmbeddings(dying, batch_size=args.batch_size, max_concurrency=1), "fake", cache)
+        try:
+            cached.embed_documents(texts)
+        except RuntimeError:
+            pass
+        done = len(cache)
+
+        resumed = HashEmbeddings(latency=args.latency)
+        cached = CachedEmbeddings(BatchedEmbeddings(resumed, batch_size=args.batch_size), "fake", cache)
+        cached.embed_documents(texts)
+        print(f"resume after failure         checkpointed={done} re-embedded={resumed.texts_embedded} of {len(texts)}")
+
+
+if __name__ == "__main__":
+    main()
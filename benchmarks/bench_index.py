@@ -0,0 +1,67 @@
+# benchmarks/bench_index.py
+#
+# Recall-vs-latency comparison of the index modes offered by index_factory
+# against the exact flat baseline, on clustered synthetic vectors.
+#
+#   python benchmarks/bench_index.py --vectors 100000 --dim 768
+
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_factory import INDEX_MODES, build_index
+
+
+def clustered_vectors(n: int, dim: int, clusters: int = 200, seed: int = 0):
+    # Embeddings of real text are clustered by topic, not uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.15 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    # Queries come from the same topic clusters as the corpus
+    vectors = clustered_vectors(args.vectors + args.queries, args.dim)
+    data, queries = vectors[:args.vectors], vectors[args.vectors:]
+    truth = None
+
+    print(f"{'mode':<7} {'build s':>8} {'size MB':>8} {'p50 ms':>7} {'p95 ms':>7} {f'recall@{args.k}':>9}")
+    for mode in INDEX_MODES:
+        start = time.perf_counter()
+        index = build_index(data, mode)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        latencies, results = [], []
+        for q in queries:
+            t = time.perf_counter()
+            _, ids = index.search(q[None, :], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            results.append(ids[0])
+
+        if truth is None:
+            truth = results
+        recall = np.mean([len(set(r) & set(t)) / args.k for r, t in zip(results, truth)])
+        print(
+            f"{mode:<7} {build_seconds:>8.2f} {size_mb:>8.1f} "
+            f"{np.percentile(latencies, 50):>7.3f} {np.percentile(latencies, 95):>7.3f} {recall:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
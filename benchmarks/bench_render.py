@@ -0,0 +1,50 @@
+# benchmarks/bench_render.py
+#
+# Rendering through render_pool against a local HTML fixture site: a fresh
+# browser per page (the old SeleniumURLLoader behaviour) versus warm
+# browsers reused across pages. By default the fake browser stands in for
+# Chrome with a fixed startup cost; --chrome uses real headless Chrome.
+#
+#   python benchmarks/bench_render.py --pages 40 --workers 2 --startup 1.0
+
+import os
+import sys
+import time
+import argparse
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import FixtureServer, write_html_site
+from fake_backends import fake_browser
+from render_pool import RenderPool, chrome_driver, PAGES_PER_BROWSER
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--startup", type=float, default=1.0, help="Fake browser startup seconds")
+    parser.add_argument("--chrome", action="store_true", help="Render with real headless Chrome")
+    args = parser.parse_args()
+
+    factory = chrome_driver if args.chrome else partial(fake_browser, startup_seconds=args.startup)
+
+    with FixtureServer() as server:
+        urls = [server.url(p) for p in write_html_site(server.directory, args.pages)]
+
+        print(f"{'mode':<18} {'seconds':>8} {'pages/s':>8} {'browser starts':>15} {'failed':>7}")
+        for name, pages_per_browser in (("browser per page", 1), ("warm pool", PAGES_PER_BROWSER)):
+            pool = RenderPool(workers=args.workers, driver_factory=factory, pages_per_browser=pages_per_browser)
+            start = time.perf_counter()
+            # One single-URL render, then the rest as a batch, like the Web QA tab
+            pool.render(urls[0])
+            pool.render_many(urls[1:])
+            elapsed = time.perf_counter() - start
+            stats = pool.stats()
+            pool.shutdown()
+            print(f"{name:<18} {elapsed:>8.2f} {args.pages / elapsed:>8.1f} {stats['browser_starts']:>15} {stats['failed']:>7}")
+
+
+if __name__ == "__main__":
+    main()
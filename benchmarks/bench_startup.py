@@ -0,0 +1,74 @@
+# benchmarks/bench_startup.py
+#
+# Cold-start import time of the modules app.py loads (each in a fresh
+# interpreter) and the per-request cost of building a Gemini client versus
+# reusing the shared one from resources. No network calls are made.
+#
+#   python benchmarks/bench_startup.py --runs 5
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import warnings
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# What the app imports at startup, then what each tab adds on first use
+MODULES = ["rag_utils", "crawl_utils", "pdf_utils", "youtube_utils"]
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def cold_import_seconds(module: str, runs: int):
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "offline"))
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", IMPORT_SNIPPET.format(module=module)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def client_seconds(runs: int):
+    os.environ.setdefault("GOOGLE_API_KEY", "offline")
+    warnings.filterwarnings("ignore")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from resources import get_chat_model
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.2)
+    fresh = (time.perf_counter() - start) / runs
+
+    get_chat_model()
+    start = time.perf_counter()
+    for _ in range(runs):
+        get_chat_model()
+    shared = (time.perf_counter() - start) / runs
+    return fresh, shared
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'module':<14} {'cold import s':>14}")
+    for module in MODULES:
+        seconds = cold_import_seconds(module, args.runs)
+        print(f"{module:<14} {'unavailable' if seconds is None else f'{seconds:.2f}':>14}")
+
+    fresh, shared = client_seconds(args.runs * 20)
+    print(f"\nper-request chat client: new {fresh * 1000:.2f} ms, shared {shared * 1000:.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
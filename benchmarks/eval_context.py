@@ -0,0 +1,70 @@
+# benchmarks/eval_context.py
+#
+# Offline comparison of the old top-3 context against the reranked, packed
+# context from context_utils: prompt tokens and whether the gold fact made
+# it into the context. Facts are planted in synthetic text that is split with
+# the app's splitter (so chunk overlap is present) and partly duplicated.
+#
+#   python benchmarks/eval_context.py --facts 50
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from fake_backends import HashEmbeddings
+from lexical_index import hybrid_retriever
+from context_utils import CONTEXT_FETCH_K, CONTEXT_MAX_TOKENS, estimate_tokens, pack_context
+from fixtures import synthetic_paragraphs
+
+
+def build_corpus(facts: int, seed: int = 0):
+    rng = random.Random(seed)
+    paragraphs = synthetic_paragraphs(facts * 4, seed=seed)
+    gold = []
+    for i in range(facts):
+        code = f"K-{rng.randrange(10**6):06d}"
+        fact = f"The access code for vault {i} is {code}, issued by the records office."
+        paragraphs[i * 4 + 1] += " " + fact
+        # Mirrored pages repeat some facts verbatim
+        if i % 3 == 0:
+            paragraphs[(i * 4 + 3) % len(paragraphs)] += " " + fact
+        gold.append((f"What is the access code for vault {i}?", code))
+    return "\n\n".join(paragraphs), gold
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--facts", type=int, default=50)
+    parser.add_argument("--max-tokens", type=int, default=CONTEXT_MAX_TOKENS)
+    args = parser.parse_args()
+
+    text, gold = build_corpus(args.facts)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    vectorstore = FAISS.from_texts(splitter.split_text(text), HashEmbeddings())
+
+    baseline = hybrid_retriever(vectorstore, k=3)
+    overfetch = hybrid_retriever(vectorstore, k=CONTEXT_FETCH_K)
+
+    results = {"top-3": [], "packed": []}
+    for question, code in gold:
+        contexts = {
+            "top-3": "\n\n".join(doc.page_content for doc in baseline.invoke(question)),
+            "packed": pack_context(question, overfetch.invoke(question), args.max_tokens),
+        }
+        for name, context in contexts.items():
+            results[name].append((estimate_tokens(context), code in context))
+
+    print(f"{'context':<8} {'mean tokens':>12} {'max tokens':>11} {'recall':>7}")
+    for name, rows in results.items():
+        tokens = [t for t, _ in rows]
+        recall = sum(hit for _, hit in rows) / len(rows)
+        print(f"{name:<8} {sum(tokens) / len(tokens):>12.0f} {max(tokens):>11} {recall:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
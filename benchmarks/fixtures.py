@@ -0,0 +1,91 @@
+# benchmarks/fixtures.py
+
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+import threading
+import tempfile
+import random
+import os
+
+
+WORDS = (
+    "retrieval augmented generation vector index embedding transcript summary "
+    "question answer context document chunk latency throughput cache model "
+    "python streamlit gemini faiss page video pdf search token budget memory"
+).split()
+
+
+def synthetic_paragraphs(n: int, seed: int = 0, words_per_paragraph: int = 80):
+    rng = random.Random(seed)
+    return [
+        f"Section {i}. " + " ".join(rng.choice(WORDS) for _ in range(words_per_paragraph)) + "."
+        for i in range(n)
+    ]
+
+
+def write_html_site(directory: str, pages: int, paragraphs_per_page: int = 20, seed: int = 0):
+    # Writes page_<i>.html files plus a sitemap.xml that lists them
+    for i in range(pages):
+        body = "".join(f"<p>{p}</p>" for p in synthetic_paragraphs(paragraphs_per_page, seed=seed + i))
+        with open(os.path.join(directory, f"page_{i}.html"), "w", encoding="utf-8") as f:
+            f.write(f"<html><head><title>Page {i}</title><script>var x = 1;</script></head><body><h1>Page {i}</h1>{body}</body></html>")
+    return [f"page_{i}.html" for i in range(pages)]
+
+
+def write_pdf(path: str, pages: int, paragraphs_per_page: int = 4, seed: int = 0):
+    # A text PDF of synthetic paragraphs, one group per page
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_font("Arial", size=11)
+    for i in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 6, "\n\n".join(synthetic_paragraphs(paragraphs_per_page, seed=seed + i)))
+    pdf.output(path, "F")
+    return path
+
+
+def synthetic_transcript(minutes: int, seed: int = 0, snippet_seconds: float = 4.0):
+    # Snippets shaped like fetch_yt_snippets output: {"text", "start", "duration"}
+    rng = random.Random(seed)
+    return [
+        {"text": " ".join(rng.choice(WORDS) for _ in range(10)), "start": i * snippet_seconds, "duration": snippet_seconds}
+        for i in range(int(minutes * 60 / snippet_seconds))
+    ]
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    # Serves a directory on 127.0.0.1 from a background thread
+    def __init__(self, directory: str = None):
+        self._tmp = None
+        if directory is None:
+            self._tmp = tempfile.TemporaryDirectory()
+            directory = self._tmp.name
+        self.directory = directory
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=directory))
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def write_sitemap(self, paths, name: str = "sitemap.xml"):
+        locs = "".join(f"<url><loc>{self.url(p)}</loc></url>" for p in paths)
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            f.write(f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>')
+        return self.url(name)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._tmp:
+            self._tmp.cleanup()
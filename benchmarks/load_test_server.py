@@ -0,0 +1,96 @@
+# benchmarks/load_test_server.py
+#
+# Local load test for server.py with stubbed models: starts the service
+# in-process, ingests a synthetic document, then fires concurrent /ask
+# requests drawn from a small pool of questions so duplicates coalesce.
+#
+#   python benchmarks/load_test_server.py --requests 500 --clients 64 --distinct 50
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import synthetic_paragraphs
+from fake_backends import EchoChatModel, HashEmbeddings
+from server import RAGService
+
+
+async def run(args):
+    service = RAGService(
+        llm=EchoChatModel(latency=args.llm_latency), embeddings=HashEmbeddings(),
+        max_inflight=args.max_inflight, max_queue=args.max_queue,
+    )
+    runner = web.AppRunner(service.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "doc.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(synthetic_paragraphs(300)))
+
+        async with aiohttp.ClientSession() as session:
+            # Concurrent ingests of the same document collapse into one
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                session.post(f"{base}/ingest", json={"sources": [f"text:{path}"]}) for _ in range(8)
+            ))
+            index_id = (await responses[0].json())["index_id"]
+            print(f"ingest: 8 concurrent requests in {time.perf_counter() - start:.2f}s")
+
+            latencies, statuses = [], {}
+            queue = asyncio.Queue()
+            for i in range(args.requests):
+                queue.put_nowait(f"What does section {i % args.distinct} say about cache latency?")
+
+            async def client():
+                while not queue.empty():
+                    question = queue.get_nowait()
+                    t = time.perf_counter()
+                    async with session.post(f"{base}/ask", json={"question": question, "index_id": index_id}) as response:
+                        await response.read()
+                        statuses[response.status] = statuses.get(response.status, 0) + 1
+                    latencies.append(time.perf_counter() - t)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(args.clients)))
+            elapsed = time.perf_counter() - start
+
+            async with session.get(f"{base}/stats") as response:
+                stats = await response.json()
+
+    await runner.cleanup()
+
+    latencies.sort()
+    print(f"ask: {args.requests} requests, {args.clients} clients, {elapsed:.2f}s, {args.requests / elapsed:.0f} req/s")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+    print(f"statuses {statuses}")
+    print(f"upstream calls {stats['upstream_calls']}, coalesced {stats['coalesced']}, rejected {stats['rejected']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--max-inflight", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
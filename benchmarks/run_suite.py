@@ -0,0 +1,311 @@
+# benchmarks/run_suite.py
+#
+# Reproducible offline benchmark suite. Builds synthetic corpora (HTML
+# pages served locally, generated PDFs, transcript fixtures, plain text) at
+# several sizes and measures, with the deterministic fake backends:
+#   - ingest throughput and peak memory per source type and for all at once
+#   - retrieval latency percentiles (single queries) and batch throughput
+#   - end-to-end QA latency percentiles and batch throughput
+# Results go to a JSON file; --compare checks them against an earlier run
+# and exits non-zero when a metric regressed by more than --threshold.
+#
+#   python benchmarks/run_suite.py --sizes small,medium --output results.json
+#   python benchmarks/run_suite.py --output new.json --compare results.json
+
+import os
+import sys
+import json
+import gc
+import time
+import random
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import atexit
+import shutil
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Every run starts from empty caches; set before the project modules read it
+os.environ["MIRAG_CACHE_DIR"] = tempfile.mkdtemp(prefix="mirag-suite-")
+atexit.register(shutil.rmtree, os.environ["MIRAG_CACHE_DIR"], ignore_errors=True)
+os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+from fixtures import FixtureServer, WORDS, synthetic_paragraphs, synthetic_transcript, write_html_site, write_pdf
+from fake_backends import EchoChatModel, HashEmbeddings
+from youtube_utils import TRANSCRIPT_DIR
+from engine import RAGEngine
+
+SUITE_VERSION = 1
+
+# size -> (html pages, pdfs, pages per pdf, videos, minutes per video, text paragraphs)
+SIZES = {
+    "small": (20, 2, 10, 2, 10, 200),
+    "medium": (100, 5, 40, 5, 30, 1000),
+    "large": (400, 10, 100, 10, 60, 5000),
+}
+
+# Direction of each metric, by suffix: lower or higher is better. p99 over a
+# few hundred samples is mostly GC and scheduler noise, so it is reported
+# but never counted as a regression; neither are changes below the floors.
+LOWER_IS_BETTER = ("_ms", "_seconds", "_mb")
+HIGHER_IS_BETTER = ("_per_second",)
+NOT_GATED = ("p99_ms", "corpus_mb", "chunks", "embed_calls")
+NOISE_FLOOR = {"_ms": 1.0, "_seconds": 0.05, "_mb": 5.0}
+
+
+class PeakMemory:
+    # Samples resident memory on a thread; reports the peak above the
+    # starting point. Uses psutil when installed, else /proc on Linux.
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        try:
+            import psutil
+            process = psutil.Process()
+            self._rss = lambda: process.memory_info().rss
+        except ImportError:
+            page_size = os.sysconf("SC_PAGE_SIZE")
+
+            def rss():
+                with open("/proc/self/statm") as f:
+                    return int(f.read().split()[1]) * page_size
+            self._rss = rss
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self._rss())
+
+    def __enter__(self):
+        self._start = self._peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, self._rss())
+        self.peak_mb = (self._peak - self._start) / 1e6
+
+
+def percentiles(samples_ms):
+    samples = sorted(samples_ms)
+    def at(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": statistics.median(samples), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def build_corpus(size: str, directory: str, server, seed: int):
+    # -> {source type: [engine source specs]}, plus the corpus size in bytes
+    pages, pdfs, pdf_pages, videos, minutes, paragraphs = SIZES[size]
+
+    paths = write_html_site(server.directory, pages, seed=seed)
+    web = [f"url:{server.write_sitemap(paths, name=f'sitemap-{size}.xml')}"]
+
+    pdf = [f"pdf:{write_pdf(os.path.join(directory, f'{size}-{i}.pdf'), pdf_pages, seed=seed + 1000 * i)}" for i in range(pdfs)]
+
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+    youtube = []
+    for i in range(videos):
+        video_id = f"{size[:3]}{seed % 100:02d}{i:06d}"[:11]
+        with open(os.path.join(TRANSCRIPT_DIR, f"{video_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(synthetic_transcript(minutes, seed=seed + i), f)
+        youtube.append(f"youtube:https://www.youtube.com/watch?v={video_id}")
+
+    text_path = os.path.join(directory, f"{size}.txt")
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(synthetic_paragraphs(paragraphs, seed=seed)))
+
+    total_bytes = sum(os.path.getsize(os.path.join(server.directory, p)) for p in paths)
+    total_bytes += sum(os.path.getsize(spec[4:]) for spec in pdf) + os.path.getsize(text_path)
+    return {"web": web, "pdf": pdf, "youtube": youtube, "text": [f"text:{text_path}"]}, total_bytes
+
+
+def measure_ingest(sources, args):
+    # Best of --repeat cold ingests. Each run names its embedding model
+    # differently so the index store cannot hand back the previous build.
+    best = None
+    for run in range(args.repeat):
+        embeddings = HashEmbeddings(size=args.dim, latency=args.embed_latency)
+        embeddings.model = f"{embeddings.model}-run{run}"
+        engine = RAGEngine(llm=EchoChatModel(latency=args.llm_latency), embeddings=embeddings, concurrency=args.concurrency)
+        gc.collect()
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            stats = engine.ingest(sources)
+            elapsed = time.perf_counter() - start
+        if stats["errors"]:
+            raise RuntimeError(f"Ingest failed for {stats['errors']}")
+        if best is None or elapsed < best[1]["seconds"]:
+            best = engine, {
+                "seconds": elapsed,
+                "chunks": stats["chunks"],
+                "chunks_per_second": stats["chunks"] / elapsed,
+                "embed_calls": embeddings.calls,
+                "peak_mb": memory.peak_mb,
+            }
+    return best
+
+
+def run_size(size: str, args, server, directory: str):
+    corpus, total_bytes = build_corpus(size, directory, server, args.seed)
+    result = {"corpus_mb": total_bytes / 1e6}
+
+    for kind, sources in corpus.items():
+        _, result[f"ingest.{kind}"] = measure_ingest(sources, args)
+
+    engine, result["ingest.all"] = measure_ingest([s for sources in corpus.values() for s in sources], args)
+    result["ingest.all"]["mb_per_second"] = total_bytes / 1e6 / result["ingest.all"]["seconds"]
+
+    rng = random.Random(args.seed)
+    questions = [f"What does section {rng.randrange(100)} say about {rng.choice(WORDS)} and {rng.choice(WORDS)}?" for _ in range(args.queries)]
+
+    # Warm up imports and lazily built structures before timing
+    engine.retriever.invoke(questions[0])
+    engine.qa_chain().invoke({"question": questions[0], "query": questions[0], "memory": ""})
+
+    gc.collect()
+    samples = []
+    for q in questions:
+        start = time.perf_counter()
+        engine.retriever.invoke(q)
+        samples.append((time.perf_counter() - start) * 1000)
+    batch_seconds = min(timed(lambda: engine.retriever.retrieve_many(questions, max_workers=args.concurrency)) for _ in range(args.repeat))
+    result["retrieval"] = {**percentiles(samples), "batch_queries_per_second": len(questions) / batch_seconds}
+
+    gc.collect()
+    chain, samples = engine.qa_chain(), []
+    for q in questions:
+        start = time.perf_counter()
+        chain.invoke({"question": q, "query": q, "memory": ""})
+        samples.append((time.perf_counter() - start) * 1000)
+    batch_seconds = min(timed(lambda: engine.answer_many(questions)) for _ in range(args.repeat))
+    result["qa"] = {**percentiles(samples), "batch_questions_per_second": len(questions) / batch_seconds}
+    return result
+
+
+def environment():
+    import faiss
+    import numpy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "faiss": faiss.__version__,
+        "git_commit": commit,
+    }
+
+
+def flatten(results):
+    # {"small": {"ingest.pdf": {"seconds": 1.0}}} -> {"small/ingest.pdf.seconds": 1.0}
+    flat = {}
+    for size, groups in results.items():
+        for group, metrics in groups.items():
+            if isinstance(metrics, dict):
+                flat.update((f"{size}/{group}.{name}", value) for name, value in metrics.items())
+            else:
+                flat[f"{size}/{group}"] = metrics
+    return flat
+
+
+def compare(current, baseline, threshold: float):
+    # Prints every metric whose direction is known and returns the regressions
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions = []
+    print(f"\n{'metric':<52} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        floor = next((v for suffix, v in NOISE_FLOOR.items() if name.endswith(suffix)), 0.0)
+        if name.endswith(NOT_GATED):
+            worse = False
+        elif name.endswith(LOWER_IS_BETTER):
+            worse = change > threshold and after - before > floor
+        elif name.endswith(HIGHER_IS_BETTER):
+            worse = change < -threshold
+        else:
+            worse = False
+        print(f"{name:<52} {before:>10.2f} {after:>10.2f} {change:>+8.0%}{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Earlier results JSON to check against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change counted as a regression")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per ingest / batch measurement; the best is kept")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding call")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes {unknown}, expected some of {list(SIZES)}")
+
+    results = {}
+    with FixtureServer() as server, tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            start = time.perf_counter()
+            results[size] = run_size(size, args, server, directory)
+            all_stats = results[size]["ingest.all"]
+            print(
+                f"{size:<7} corpus {results[size]['corpus_mb']:.1f} MB, {all_stats['chunks']} chunks, "
+                f"ingest {all_stats['seconds']:.2f}s (+{all_stats['peak_mb']:.0f} MB), "
+                f"retrieval p95 {results[size]['retrieval']['p95_ms']:.1f} ms, "
+                f"QA p95 {results[size]['qa']['p95_ms']:.1f} ms  [{time.perf_counter() - start:.0f}s]"
+            )
+
+    report = {
+        "suite": "mirag-offline",
+        "version": SUITE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("version") != SUITE_VERSION or baseline.get("config", {}).get("seed") != args.seed:
+            print("Warning: baseline was produced with a different suite version or seed", file=sys.stderr)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# cache_utils.py
+
+from langchain_core.embeddings import Embeddings
+from metrics_utils import span
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+
+CACHE_DIR = os.getenv("MIRAG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mirag"))
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("MIRAG_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    # Persistent (model, sha256(text)) -> vector store backed by SQLite.
+    # Rows carry a last_used timestamp so the table can be trimmed LRU-style.
+
+    def __init__(self, path: str = None, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes):
+        found = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite caps the number of bound parameters, so look up in slices
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, items):
+        now = time.time()
+        rows = [
+            (model, h, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for h, vector in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps any LangChain embedding model so that only chunks missing from
+    # the cache are sent to the underlying API.
+
+    def __init__(self, underlying: Embeddings, model: str, cache: EmbeddingCache = None):
+        self.underlying = underlying
+        self.model = model
+        self.cache = cache if cache is not None else get_embedding_cache()
+
+        # Batching clients report each finished batch, so progress is
+        # persisted as it happens and a failed ingest resumes from the cache
+        self._checkpointing = hasattr(underlying, "on_batch") and underlying.on_batch is None
+        if self._checkpointing:
+            underlying.on_batch = self._checkpoint
+
+    def _checkpoint(self, texts, vectors):
+        self.cache.put_many(self.model, [(text_hash(t), v) for t, v in zip(texts, vectors)])
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        with span("embed.documents", texts=len(texts)) as s:
+            hashes = [text_hash(t) for t in texts]
+            cached = self.cache.get_many(self.model, hashes)
+
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in cached and h not in missing:
+                    missing[h] = t
+            s.set(cache_hits=len(texts) - len(missing), embedded=len(missing))
+
+            if missing:
+                vectors = self.underlying.embed_documents(list(missing.values()))
+                new_items = list(zip(missing.keys(), vectors))
+                if not self._checkpointing:
+                    self.cache.put_many(self.model, new_items)
+                cached.update(new_items)
+
+            return [list(cached[h]) for h in hashes]
+
+    def embed_query(self, text):
+        # Query embeddings use a different task type upstream, keep them apart
+        key = f"query:{self.model}"
+        h = text_hash(text)
+        with span("embed.query") as s:
+            cached = self.cache.get_many(key, [h])
+            s.set(cache_hit=h in cached)
+            if h in cached:
+                return cached[h]
+            vector = self.underlying.embed_query(text)
+            self.cache.put_many(key, [(h, vector)])
+            return vector
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL):
+    # One client per model for the whole process, built on first use
+    from resources import shared
+
+    def build():
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        from embedding_executor import BatchedEmbeddings
+        return CachedEmbeddings(BatchedEmbeddings(GoogleGenerativeAIEmbeddings(model=model)), model)
+
+    return shared(("embeddings", model), build)
+
+
+def embedding_cache_stats():
+    return get_embedding_cache().stats()
+
+
+class SummaryCache:
+    # Persistent key -> summary text store for the hierarchical summarizer,
+    # kept in the same SQLite database as the embeddings.
+
+    def __init__(self, path: str = None, max_entries: int = 20000):
+        self.path = path or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+_summary_cache = None
+
+
+def get_summary_cache():
+    global _summary_cache
+    with _embedding_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = SummaryCache()
+        return _summary_cache
@@ -0,0 +1,184 @@
+# chunking.py
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+import zlib
+import re
+import os
+
+
+CHARS_PER_TOKEN = 4     # same estimate as context_utils.estimate_tokens
+DEFAULT_STRATEGY = os.getenv("MIRAG_CHUNKER", "structured")
+
+# source type -> (chunk tokens, overlap tokens). Larger chunks than the old
+# 500-char default mean fewer embedding calls; the context packer still
+# trims what reaches the prompt.
+SOURCE_PROFILES = {
+    "web": (200, 20),
+    "pdf": (200, 20),
+    "text": (160, 25),
+}
+CHUNK_TOKENS = os.getenv("MIRAG_CHUNK_TOKENS")   # overrides every profile when set
+
+# A heading is a short "#" line; longer ones are text that happens to start with "#"
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+([^\n]{1,200}?)[ \t]*$", re.MULTILINE)
+
+# Preferred cut points inside an over-long sentence, best first
+_BREAKS = ("; ", ", ", " ")
+LINE_PATTERN = re.compile(r"[^\n]+")
+SENTENCE_PATTERN = re.compile(r".+?(?:[.?!](?=\s)|$)")
+# A chunk may close after a unit whose checksum is divisible by this (about
+# one unit in four), once it is at least half the budget
+BOUNDARY_MODULUS = 4
+# Shorter chunks (a stray title, a lone nav line) are dropped when the
+# document has other chunks
+MIN_CHUNK_CHARS = 20
+
+
+class FastSplitter:
+    # Single pass over the text. It is cut into units (lines; sentences of
+    # over-long lines; word-aligned windows of over-long sentences) that are
+    # packed into chunks. A chunk closes after a unit whose content hits the
+    # boundary condition, or when the next unit would not fit, so chunk
+    # edges depend on the text around them only: an edit changes the chunks
+    # it touches, not every chunk after it, and re-indexing a changed page
+    # re-embeds little. Linear in the input, so multi-MB pages split in
+    # milliseconds.
+
+    def __init__(self, chunk_tokens: int = 200, overlap_tokens: int = 20):
+        self.chunk_chars = chunk_tokens * CHARS_PER_TOKEN
+        self.overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, self.chunk_chars // 2)
+
+    def _cut(self, text: str, start: int, end: int) -> int:
+        low = start + self.chunk_chars // 2
+        for separator in _BREAKS:
+            i = text.rfind(separator, low, end)
+            if i != -1:
+                return i + len(separator)
+        return end
+
+    def _units(self, text: str):
+        # -> (start, end) spans of at most chunk_chars each
+        for line in LINE_PATTERN.finditer(text):
+            if line.end() - line.start() <= self.chunk_chars:
+                yield line.span()
+                continue
+            for sentence in SENTENCE_PATTERN.finditer(text, line.start(), line.end()):
+                start, end = sentence.span()
+                while end - start > self.chunk_chars:
+                    cut = self._cut(text, start, start + self.chunk_chars)
+                    yield start, cut
+                    start = cut
+                yield start, end
+
+    def split_text(self, text: str):
+        # The current chunk is text[begin:last]; last is None until it holds a unit
+        chunks, begin, last = [], None, None
+
+        def close(cut):
+            chunk = text[begin:cut].strip()
+            if chunk:
+                chunks.append(chunk)
+            # The next chunk starts with this one's tail, from a word start
+            space = text.find(" ", cut - self.overlap_chars, cut)
+            return space + 1 if self.overlap_chars and space != -1 else None
+
+        for start, end in self._units(text):
+            # The next unit does not fit; a chunk too short to stand alone
+            # takes it anyway, going a little over budget
+            if last is not None and end - begin > self.chunk_chars and last - begin >= MIN_CHUNK_CHARS:
+                begin, last = close(last), None
+            if begin is None or last is None and end - begin > self.chunk_chars:
+                begin = start
+            last = end
+            if end - begin >= self.chunk_chars // 2 and zlib.crc32(text[start:end].encode("utf-8")) % BOUNDARY_MODULUS == 0:
+                begin, last = close(end), None
+        if last is not None:
+            close(last)
+        return [chunk for chunk in chunks if len(chunk) >= MIN_CHUNK_CHARS] or chunks
+
+    def split_documents(self, docs):
+        # One document never spills into another (PDF pages stay separate);
+        # chunks keep their document's metadata
+        return [
+            Document(page_content=chunk, metadata=dict(doc.metadata))
+            for doc in docs for chunk in self.split_text(doc.page_content)
+        ]
+
+
+class StructuredSplitter(FastSplitter):
+    # Splits at markdown-style headings first (html_to_text marks HTML
+    # h1-h6 this way), packs small neighbouring sections together and only
+    # cuts inside a section that is over budget. Chunks carry the heading
+    # path in metadata["section"].
+
+    def sections(self, text: str):
+        # -> [(heading path, section text)]; text before the first heading has no path
+        sections, path, last = [], [], 0
+        for match in HEADING_PATTERN.finditer(text):
+            if match.start() > last:
+                sections.append((" > ".join(title for _, title in path), text[last:match.start()]))
+            level = len(match.group(1))
+            path = [(l, t) for l, t in path if l < level] + [(level, match.group(2))]
+            last = match.start()
+        sections.append((" > ".join(title for _, title in path), text[last:]))
+        return [(heading, body.strip()) for heading, body in sections if body.strip()]
+
+    def split_sections(self, text: str):
+        # -> [(heading path, chunk)]
+        chunks, heading, parts, size = [], None, [], 0
+        for section_heading, body in self.sections(text):
+            if parts and size + len(body) > self.chunk_chars:
+                if size < MIN_CHUNK_CHARS:
+                    # Too small to stand alone: lead into this section instead
+                    body = "\n\n".join(parts + [body])
+                else:
+                    chunks.append((heading, "\n\n".join(parts)))
+                parts, size = [], 0
+            if len(body) > self.chunk_chars:
+                chunks.extend((section_heading, chunk) for chunk in super().split_text(body))
+                continue
+            if not parts or not heading:
+                heading = section_heading
+            parts.append(body)
+            size += len(body) + 2
+        if parts:
+            chunks.append((heading, "\n\n".join(parts)))
+        return [chunk for chunk in chunks if len(chunk[1]) >= MIN_CHUNK_CHARS] or chunks
+
+    def split_text(self, text: str):
+        return [chunk for _, chunk in self.split_sections(text)]
+
+    def split_documents(self, docs):
+        result = []
+        for doc in docs:
+            for heading, chunk in self.split_sections(doc.page_content):
+                metadata = dict(doc.metadata)
+                if heading:
+                    metadata["section"] = heading
+                result.append(Document(page_content=chunk, metadata=metadata))
+        return result
+
+
+class RecursiveSplitter(RecursiveCharacterTextSplitter):
+    # LangChain's recursive splitter sized in tokens, kept for comparison
+    def __init__(self, chunk_tokens: int = 200, overlap_tokens: int = 20):
+        super().__init__(chunk_size=chunk_tokens * CHARS_PER_TOKEN, chunk_overlap=overlap_tokens * CHARS_PER_TOKEN)
+
+
+CHUNKERS = {
+    "structured": StructuredSplitter,
+    "fast": FastSplitter,
+    "recursive": RecursiveSplitter,
+}
+
+
+def get_splitter(source_type: str = "text", strategy: str = None, chunk_tokens: int = None, overlap_tokens: int = None):
+    # Splitter tuned for a source type; every loader gets its splitter here
+    strategy = strategy or DEFAULT_STRATEGY
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {tuple(CHUNKERS)}")
+    default_tokens, default_overlap = SOURCE_PROFILES.get(source_type, SOURCE_PROFILES["text"])
+    if CHUNK_TOKENS:
+        default_tokens = int(CHUNK_TOKENS)
+    return CHUNKERS[strategy](chunk_tokens or default_tokens, default_overlap if overlap_tokens is None else overlap_tokens)
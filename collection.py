@@ -0,0 +1,364 @@
+# collection.py
+
+from langchain_core.documents import Document
+from cache_utils import get_embeddings, text_hash
+from index_store import vectorstore_key
+from lexical_index import BM25Index, HybridRetriever, attach_lexical_index, get_lexical_index, tokenize
+from contextlib import nullcontext
+from operator import itemgetter
+import heapq
+import numpy as np
+import threading
+import itertools
+
+
+SOURCE_TYPES = ("web", "pdf", "youtube", "text")
+LOCAL_STORE = "local"
+
+
+class _Docstore:
+    def __init__(self, collection, sources, types):
+        self.collection = collection
+        self.sources = sources
+        self.types = types
+
+    def search(self, doc_id):
+        return self.collection.document(doc_id, self.sources, self.types)
+
+
+class _FilteredVectors:
+    # The slice of a collection a retriever may see, shaped like the parts of
+    # a LangChain FAISS store that HybridRetriever uses. Filters are resolved
+    # per search, so a retriever stays valid as sources come and go.
+
+    def __init__(self, collection, sources, types):
+        self.collection = collection
+        self.sources = sources
+        self.types = types
+        self.embeddings = collection.embeddings
+        self.docstore = _Docstore(collection, sources, types)
+
+    def similarity_search(self, query: str, k: int = 4):
+        return self.collection.similarity_search(query, k, self.sources, self.types)
+
+    def similarity_search_by_vector(self, vector, k: int = 4):
+        return self.collection.similarity_search_by_vector(vector, k, self.sources, self.types)
+
+
+class _FilteredLexical:
+    def __init__(self, collection, sources, types):
+        self.collection = collection
+        self.sources = sources
+        self.types = types
+
+    def search(self, query: str, k: int = 10):
+        return self.collection.lexical_search(query, k, self.sources, self.types)
+
+    def covers(self, doc_id: str, query: str) -> bool:
+        return self.collection.covers(doc_id, query, self.sources, self.types)
+
+
+def _search_store(vectorstore, vector, k: int, allowed):
+    # -> [(distance, doc id)] from one FAISS store; `allowed` (doc ids) or
+    # None for all of it. Filtered searches over-fetch until k hits pass.
+    index = vectorstore.index
+    n = index.ntotal
+    if not n:
+        return []
+    if getattr(vectorstore, "_normalize_L2", False):
+        vector = vector / np.linalg.norm(vector, axis=1, keepdims=True)
+    fetch = min(n, k if allowed is None else max(k, k * n // max(len(allowed), 1)))
+    # Stores edited in place (live web, growing PDF) carry a search lock
+    with getattr(vectorstore, "_lock", None) or nullcontext():
+        while True:
+            distances, rows = index.search(vector, fetch)
+            hits = [
+                (float(d), vectorstore.index_to_docstore_id[row])
+                for d, row in zip(distances[0], rows[0]) if row != -1
+            ]
+            if allowed is not None:
+                hits = [hit for hit in hits if hit[1] in allowed]
+            if len(hits) >= k or fetch >= n:
+                return hits[:k]
+            fetch = min(n, fetch * 4)
+
+
+class Collection:
+    # A session's sources from every loader, searchable together with
+    # source-type metadata and per source / per type filters. Chunks are not
+    # copied: each source points at the rows of an index the tabs already
+    # loaded (shared between sessions), and a search runs on every index
+    # holding a selected source and merges the results. Adding or removing a
+    # source only changes that bookkeeping.
+    # `resolve(key)` maps an index key back to its vectorstore (the resource
+    # manager, which may have evicted and reloaded it); without one the
+    # collection keeps the stores it was given.
+
+    def __init__(self, embeddings=None, resolve=None):
+        self._embeddings = embeddings
+        self.resolve = resolve
+        self.sources = {}                  # source_id -> {"type", "store", "ids" (None: whole store), "chunks", "rev"}
+        self.stores = {}                   # index key -> set of source ids
+        self._pinned = {}                  # index key -> vectorstore held here
+        self.version = 0
+        self._revs = itertools.count()
+        self._plans = {}                   # filter -> {index key: allowed doc ids or None}, for the current version
+        self._hits = {}                    # doc id -> index key it was last returned from
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(source["chunks"] for source in self.sources.values())
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def _vectorstore(self, key: str):
+        with self._lock:
+            vectorstore = self._pinned.get(key)
+        if vectorstore is None:
+            vectorstore = self.resolve(key)
+        return vectorstore
+
+    def add_vectorstore(self, vectorstore, source_type: str, default_source: str = "", key: str = None):
+        # One collection source per metadata["source"] of the index; re-adding
+        # a source replaces it
+        if source_type not in SOURCE_TYPES:
+            raise ValueError(f"Unknown source type {source_type!r}, expected one of {SOURCE_TYPES}")
+        key = key or vectorstore_key(vectorstore) or f"session:{id(vectorstore)}"
+        by_source = {}
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                by_source.setdefault(doc.metadata.get("source") or default_source, set()).add(doc_id)
+
+        with self._lock:
+            if self.resolve is None:
+                self._pinned[key] = vectorstore
+            whole = len(by_source) == 1
+            for source_id, ids in by_source.items():
+                self._add(source_id, source_type, key, None if whole else frozenset(ids), len(ids))
+            self._changed()
+        return list(by_source)
+
+    def add_documents(self, source_id: str, source_type: str, docs):
+        # Chunks not loaded through a tab go into one small index owned by
+        # the collection. Vectors come from the shared embedding cache.
+        if source_type not in SOURCE_TYPES:
+            raise ValueError(f"Unknown source type {source_type!r}, expected one of {SOURCE_TYPES}")
+        texts = [doc.page_content for doc in docs]
+        if not texts:
+            return 0
+        vectors = self.embeddings.embed_documents(texts)
+
+        with self._lock:
+            self._remove(source_id)
+            store = self._local_store(len(vectors[0]))
+            ids = [f"{LOCAL_STORE}-{next(self._revs)}" for _ in texts]
+            store.add_embeddings(list(zip(texts, vectors)), metadatas=[dict(doc.metadata) for doc in docs], ids=ids)
+            get_lexical_index(store).add_many(ids, texts)
+            self._add(source_id, source_type, LOCAL_STORE, frozenset(ids), len(ids))
+            self._changed()
+        return len(ids)
+
+    def _local_store(self, dim: int):
+        store = self._pinned.get(LOCAL_STORE)
+        if store is None:
+            import faiss
+            from langchain_community.vectorstores import FAISS
+            from langchain_community.docstore.in_memory import InMemoryDocstore
+
+            store = FAISS(self.embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore(), {})
+            store._lock = self._lock          # searched and edited under the collection's lock
+            attach_lexical_index(store, BM25Index())
+            self._pinned[LOCAL_STORE] = store
+        return store
+
+    def _add(self, source_id: str, source_type: str, key: str, ids, chunks: int):
+        self._remove(source_id)
+        self.sources[source_id] = {"type": source_type, "store": key, "ids": ids, "chunks": chunks, "rev": next(self._revs)}
+        self.stores.setdefault(key, set()).add(source_id)
+
+    def _remove(self, source_id: str):
+        source = self.sources.pop(source_id, None)
+        if source is None:
+            return False
+        key = source["store"]
+        if key == LOCAL_STORE:
+            store = self._pinned[LOCAL_STORE]
+            store.delete(list(source["ids"]))
+            get_lexical_index(store).remove(source["ids"])
+        self.stores[key].discard(source_id)
+        if not self.stores[key]:
+            del self.stores[key]
+            if key != LOCAL_STORE:
+                self._pinned.pop(key, None)
+        return True
+
+    def remove_source(self, source_id: str) -> bool:
+        with self._lock:
+            removed = self._remove(source_id)
+            if removed:
+                self._changed()
+            return removed
+
+    def store_keys(self):
+        # Index keys this collection still points at
+        with self._lock:
+            return set(self.stores) - {LOCAL_STORE}
+
+    def _changed(self):
+        self.version += 1
+        self._plans.clear()
+        self._hits.clear()
+
+    def nbytes(self) -> int:
+        # Only the collection's own index; shared ones are accounted where they are held
+        with self._lock:
+            store = self._pinned.get(LOCAL_STORE)
+            if store is None:
+                return 0
+            texts = sum(len(doc.page_content) for doc in store.docstore._dict.values())
+            return store.index.ntotal * store.index.d * 4 + texts
+
+    def list_sources(self):
+        with self._lock:
+            return [{"source_id": s, "type": info["type"], "chunks": info["chunks"]} for s, info in self.sources.items()]
+
+    def _selected(self, sources=None, types=None):
+        return [
+            s for s, info in self.sources.items()
+            if (not sources or s in sources) and (not types or info["type"] in types)
+        ]
+
+    def _plan(self, sources=None, types=None):
+        # index key -> doc ids a search may return there (None: all of them)
+        key = (tuple(sorted(sources or ())), tuple(sorted(types or ())))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = {}
+                for source_id in self._selected(sources, types):
+                    source = self.sources[source_id]
+                    store = source["store"]
+                    if source["ids"] is None:
+                        plan[store] = None
+                    elif plan.get(store, ()) is not None:
+                        plan[store] = plan.get(store, frozenset()) | source["ids"]
+                self._plans[key] = plan
+            return plan
+
+    def similarity_search(self, query: str, k: int = 4, sources=None, types=None):
+        if not self._plan(sources, types):
+            return []
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, sources, types)
+
+    def similarity_search_by_vector(self, vector, k: int = 4, sources=None, types=None):
+        vector = np.asarray([vector], dtype=np.float32)
+        plan = self._plan(sources, types)
+        stores = {key: self._vectorstore(key) for key in plan}
+        hits = heapq.nsmallest(k, (
+            (distance, doc_id, key) for key, allowed in plan.items()
+            for distance, doc_id in _search_store(stores[key], vector, k, allowed)
+        ), key=itemgetter(0))
+        self._hits.update((doc_id, key) for _, doc_id, key in hits)
+        docs = (self._document(key, doc_id, stores[key]) for _, doc_id, key in hits)
+        return [doc for doc in docs if doc is not None]
+
+    def lexical_search(self, query: str, k: int = 10, sources=None, types=None):
+        # BM25 on each index, best scores across all of them. Indexes are
+        # searched best upper bound first; once k hits score above an index's
+        # bound, it and the rest cannot contribute.
+        terms = list(dict.fromkeys(tokenize(query)))
+        indexes = []
+        for key, allowed in self._plan(sources, types).items():
+            index = get_lexical_index(self._vectorstore(key))
+            bound = index.max_score(terms)
+            if bound > 0:
+                indexes.append((bound, key, allowed, index))
+        indexes.sort(key=itemgetter(0), reverse=True)
+
+        top = []            # min-heap of (score, order, doc id, key)
+        order = itertools.count()
+        for bound, key, allowed, index in indexes:
+            if len(top) >= k and bound <= top[0][0]:
+                break
+            for doc_id, score in index.search(query, k, allowed=allowed, terms=terms):
+                item = (score, -next(order), doc_id, key)
+                if len(top) < k:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+        top.sort(reverse=True)
+        # Remember where each hit came from, for the retriever's lookups that follow
+        self._hits.update((doc_id, key) for _, _, doc_id, key in top)
+        return [(doc_id, score) for score, _, doc_id, _ in top]
+
+    def _store_of(self, doc_id: str, sources=None, types=None):
+        plan = self._plan(sources, types)
+        key = self._hits.get(doc_id)
+        if key in plan and (plan[key] is None or doc_id in plan[key]):
+            return key
+        # Not a recent hit: look through the indexes
+        for key, allowed in plan.items():
+            if allowed is not None:
+                if doc_id in allowed:
+                    return key
+            elif isinstance(self._vectorstore(key).docstore.search(doc_id), Document):
+                return key
+        return None
+
+    def _source_of(self, key: str, doc_id: str):
+        with self._lock:
+            for source_id in self.stores.get(key, ()):
+                ids = self.sources[source_id]["ids"]
+                if ids is None or doc_id in ids:
+                    return source_id
+        return None
+
+    def _document(self, key: str, doc_id: str, vectorstore=None):
+        doc = (vectorstore or self._vectorstore(key)).docstore.search(doc_id)
+        source_id = self._source_of(key, doc_id)
+        if not isinstance(doc, Document) or source_id is None:
+            return None
+        metadata = dict(doc.metadata, source_id=source_id, source_type=self.sources[source_id]["type"])
+        return Document(id=doc_id, page_content=doc.page_content, metadata=metadata)
+
+    def document(self, doc_id: str, sources=None, types=None):
+        key = self._store_of(doc_id, sources, types)
+        return self._document(key, doc_id) if key is not None else None
+
+    def covers(self, doc_id: str, query: str, sources=None, types=None) -> bool:
+        key = self._store_of(doc_id, sources, types)
+        return key is not None and get_lexical_index(self._vectorstore(key)).covers(doc_id, query)
+
+    def retriever(self, k: int = 3, fetch_k: int = 10, sources=None, types=None):
+        # Hybrid BM25 + vector retriever over the filtered part of the collection
+        return HybridRetriever(
+            vectorstore=_FilteredVectors(self, sources, types),
+            lexical=_FilteredLexical(self, sources, types),
+            k=k, fetch_k=fetch_k,
+        )
+
+    def identity(self, sources=None, types=None) -> str:
+        # Changes whenever the searchable content does, for the answer cache.
+        # Built from the indexes' own identities, so sessions holding the
+        # same sources share cached answers.
+        # Stores are resolved outside the collection lock: the resolver takes
+        # the resource manager's lock, which is held while it sizes collections
+        with self._lock:
+            selected = [(s, self.sources[s]["store"], self.sources[s]["rev"]) for s in sorted(self._selected(sources, types))]
+        identities = {}
+        parts = []
+        for source_id, store, rev in selected:
+            if store == LOCAL_STORE:
+                identity = f"{LOCAL_STORE}:{id(self)}:{rev}"
+            else:
+                if store not in identities:
+                    identities[store] = vectorstore_key(self._vectorstore(store)) or store
+                identity = identities[store]
+            parts.append(f"{source_id}\x00{identity}")
+        return "collection:" + text_hash("\x00".join(parts))
@@ -0,0 +1,116 @@
+# context_utils.py
+
+from langchain_core.runnables import RunnableLambda
+from lexical_index import tokenize
+from metrics_utils import span
+import math
+import os
+
+
+CONTEXT_FETCH_K = int(os.getenv("MIRAG_CONTEXT_FETCH_K", "12"))
+CONTEXT_MAX_TOKENS = int(os.getenv("MIRAG_CONTEXT_MAX_TOKENS", "600"))
+MMR_LAMBDA = 0.7
+MIN_RELEVANCE_RATIO = float(os.getenv("MIRAG_CONTEXT_MIN_RELEVANCE", "0.7"))
+DUPLICATE_SIMILARITY = 0.8
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 300
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with Gemini's tokenizer
+    return max(1, len(text) // 4)
+
+
+def _shingles(text: str, size: int = 3):
+    words = text.lower().split()
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def trim_overlap(previous: str, text: str) -> str:
+    # Drop the prefix of `text` that repeats the tail of `previous`
+    # (what chunk_overlap leaves between neighbouring chunks)
+    longest = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+
+def rerank(query: str, docs, k: int = None, mmr_lambda: float = MMR_LAMBDA):
+    # Local MMR pass: relevance blends the retriever's rank with query-term
+    # coverage (terms weighted by rarity among the candidates), redundancy is
+    # word-shingle overlap with chunks already picked. Near-duplicates are
+    # dropped outright. Returns [(doc, relevance)].
+    terms = set(tokenize(query))
+    doc_terms = [set(tokenize(doc.page_content)) & terms for doc in docs]
+    weights = {
+        term: math.log(1 + len(docs) / (1 + sum(term in found for found in doc_terms)))
+        for term in terms
+    }
+    total_weight = sum(weights.values())
+
+    candidates = []
+    for rank, (doc, found) in enumerate(zip(docs, doc_terms)):
+        coverage = sum(weights[t] for t in found) / total_weight if total_weight else 0.0
+        relevance = 0.5 / (1 + rank) ** 0.5 + 0.5 * coverage
+        candidates.append((doc, relevance, _shingles(doc.page_content)))
+
+    selected = []
+    while candidates and (k is None or len(selected) < k):
+        best, best_score = None, None
+        for i, (doc, relevance, shingles) in enumerate(candidates):
+            redundancy = max((_jaccard(shingles, s) for _, _, s in selected), default=0.0)
+            score = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = i, score
+        doc, relevance, shingles = candidates.pop(best)
+        if any(_jaccard(shingles, s) >= DUPLICATE_SIMILARITY for _, _, s in selected):
+            continue
+        selected.append((doc, relevance, shingles))
+    return [(doc, relevance) for doc, relevance, _ in selected]
+
+
+def pack_context(query: str, docs, max_tokens: int = CONTEXT_MAX_TOKENS, min_relevance_ratio: float = MIN_RELEVANCE_RATIO):
+    # Rerank, drop weak and overlapping text, and fill up to `max_tokens`
+    with span("pack_context", candidates=len(docs)) as s:
+        context, chunks = _pack(query, docs, max_tokens, min_relevance_ratio)
+        s.set(chunks=chunks, tokens=estimate_tokens(context))
+        return context
+
+
+def _pack(query: str, docs, max_tokens: int, min_relevance_ratio: float):
+    ranked = rerank(query, docs)
+    if not ranked:
+        return "", 0
+
+    top_relevance = ranked[0][1]
+    parts, used = [], 0
+    for doc, relevance in ranked:
+        if parts and relevance < min_relevance_ratio * top_relevance:
+            break
+        text = doc.page_content
+        for previous in parts:
+            text = trim_overlap(previous, text)
+        if not text:
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > max_tokens:
+            if parts:
+                break
+            # Always keep the best chunk, cut to the budget
+            text = text[:max_tokens * 4]
+            tokens = estimate_tokens(text)
+        parts.append(text)
+        used += tokens
+    return "\n\n".join(parts), len(parts)
+
+
+def packed_context(retriever, max_tokens: int = CONTEXT_MAX_TOKENS):
+    # Runnable: question -> packed context string, for the QA chains
+    return RunnableLambda(lambda query: pack_context(query, retriever.invoke(query), max_tokens))
@@ -0,0 +1,243 @@
+# crawl_utils.py
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from concurrent.futures import ThreadPoolExecutor
+from index_store import embedding_model_name, index_key, save_index, load_index
+from lexical_index import BM25Index, attach_lexical_index, get_lexical_index
+from chunking import get_splitter
+from xml.etree import ElementTree
+from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
+
+
+DEFAULT_CONCURRENCY = 8
+EMBED_BATCH_SIZE = 64
+FETCH_TIMEOUT_SECONDS = 30
+USER_AGENT = "Mozilla/5.0 (compatible; MiRAG/1.0)"
+
+
+def html_to_text(html: str):
+    # Headings come out as markdown-style "# ..." lines for the structured splitter
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    for heading in soup(["h1", "h2", "h3", "h4", "h5", "h6"]):
+        text = heading.get_text(" ", strip=True)
+        if text:
+            heading.string = "#" * int(heading.name[1]) + " " + text
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    # The title goes to metadata; left in, it would become a chunk of its own
+    for tag in (soup.head, soup.title):
+        if tag is not None:
+            tag.decompose()
+    return title, soup.get_text("\n", strip=True)
+
+
+def parse_sitemap(xml_text: str):
+    # Returns (page urls, nested sitemap urls) from a sitemap or sitemap index
+    root = ElementTree.fromstring(xml_text)
+    locs = [e.text.strip() for e in root.iter() if e.tag.endswith("loc") and e.text]
+    if root.tag.endswith("sitemapindex"):
+        return [], locs
+    return locs, []
+
+
+def is_sitemap_url(url: str) -> bool:
+    return url.rstrip("/").lower().endswith(".xml")
+
+
+def make_session(concurrency: int = DEFAULT_CONCURRENCY):
+    # One pooled session per crawl; keep-alive connections are reused across pages
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency),
+        timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT_SECONDS),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def fetch_text(session, url: str) -> str:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.text()
+
+
+async def expand_urls(session, urls, max_depth: int = 2, errors=None):
+    # A sitemap that cannot be fetched or parsed goes to `errors` (when given)
+    # and the rest of the crawl goes on
+    pages = []
+    for url in urls:
+        if not is_sitemap_url(url):
+            pages.append(url)
+            continue
+        try:
+            found, nested = parse_sitemap(await fetch_text(session, url))
+        except Exception as e:
+            if errors is None:
+                raise
+            errors[url] = str(e)
+            continue
+        pages.extend(found)
+        if nested and max_depth > 0:
+            pages.extend(await expand_urls(session, nested, max_depth - 1, errors))
+    return list(dict.fromkeys(pages))
+
+
+def render_with_selenium(url: str):
+    # Rendered by a warm browser from the shared pool -> (text, title)
+    from render_pool import get_render_pool
+
+    return _rendered_text(get_render_pool().render(url))
+
+
+def _rendered_text(page):
+    title, text = html_to_text(page["html"])
+    return text, page["title"] or title
+
+
+async def _produce_pages(session, urls, queue, use_selenium, concurrency, errors):
+    semaphore = asyncio.Semaphore(concurrency)
+    if use_selenium:
+        from render_pool import get_render_pool
+        render_pool = get_render_pool()
+
+    async def fetch_one(url):
+        async with semaphore:
+            try:
+                if use_selenium:
+                    text, title = _rendered_text(await asyncio.wrap_future(render_pool.submit(url)))
+                else:
+                    title, text = html_to_text(await fetch_text(session, url))
+            except Exception as e:
+                errors[url] = str(e)
+                return
+        await queue.put((url, title, text))
+
+    await asyncio.gather(*(fetch_one(url) for url in urls))
+    # Not in a finally: a cancelled producer has no consumer left, and the
+    # put could block on a full queue forever
+    await queue.put(None)
+
+
+async def _stop_producer(producer):
+    # Cancel and wait out a producer whose consumer stopped early
+    if producer is not None and not producer.done():
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def crawl_and_index(
+    urls,
+    embeddings,
+    use_selenium: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = EMBED_BATCH_SIZE,
+    splitter=None,
+    session=None,
+):
+    # Fetch pages concurrently and embed their chunks while later pages are
+    # still downloading. Returns (vectorstore, page docs, {url: error}).
+    splitter = splitter or get_splitter("web")
+    own_session = session is None
+    session = session or make_session(concurrency)
+
+    loop = asyncio.get_running_loop()
+    # A single embedding worker keeps FAISS additions serial
+    embed_pool = ThreadPoolExecutor(max_workers=1)
+    state = {"vectorstore": None}
+    all_chunks = []
+
+    def embed_and_add(chunk_docs):
+        texts = [d.page_content for d in chunk_docs]
+        vectors = embeddings.embed_documents(texts)
+        metadatas = [d.metadata for d in chunk_docs]
+        if state["vectorstore"] is None:
+            state["vectorstore"] = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+            attach_lexical_index(state["vectorstore"], BM25Index.from_docstore(state["vectorstore"]))
+        else:
+            ids = state["vectorstore"].add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+            get_lexical_index(state["vectorstore"]).add_many(ids, texts)
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    errors, page_docs, pending, embed_jobs = {}, [], [], []
+    producer = None
+
+    try:
+        pages = await expand_urls(session, urls, errors=errors)
+        producer = asyncio.create_task(_produce_pages(session, pages, queue, use_selenium, concurrency, errors))
+
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            url, title, text = item
+            page = Document(page_content=text, metadata={"source": url, "title": title})
+            page_docs.append(page)
+            pending.extend(splitter.split_documents([page]))
+
+            while len(pending) >= batch_size:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                all_chunks.extend(batch)
+                embed_jobs.append(loop.run_in_executor(embed_pool, embed_and_add, batch))
+
+        await producer
+        if pending:
+            all_chunks.extend(pending)
+            embed_jobs.append(loop.run_in_executor(embed_pool, embed_and_add, pending))
+        await asyncio.gather(*embed_jobs)
+    finally:
+        # On failure or cancellation nothing may keep running behind the caller
+        await _stop_producer(producer)
+        for job in embed_jobs:
+            job.cancel()
+        await asyncio.to_thread(embed_pool.shutdown, wait=True, cancel_futures=True)
+        if own_session:
+            await session.close()
+
+    if state["vectorstore"] is None:
+        raise ValueError(f"No pages could be loaded: {errors or 'no URLs found'}")
+
+    # Publish to the shared index store like single-source builds
+    # Pages arrive in completion order; sort by source so the key is stable
+    ordered = sorted(all_chunks, key=lambda d: d.metadata["source"])
+    key = index_key(ordered, embedding_model_name(embeddings))
+    save_index(key, state["vectorstore"], source=f"{len(page_docs)} pages from {urls[0]}")
+    vectorstore = load_index(key, embeddings) or state["vectorstore"]
+    return vectorstore, page_docs, errors
+
+
+def crawl_and_index_sync(urls, embeddings, **kwargs):
+    return asyncio.run(crawl_and_index(urls, embeddings, **kwargs))
+
+
+async def crawl_pages(urls, use_selenium: bool = False, concurrency: int = DEFAULT_CONCURRENCY, session=None):
+    # Fetch only, for callers that index pages together with other sources.
+    # Returns (page docs sorted by source, {url: error}).
+    own_session = session is None
+    session = session or make_session(concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    errors, page_docs = {}, []
+    producer = None
+
+    try:
+        pages = await expand_urls(session, urls, errors=errors)
+        producer = asyncio.create_task(_produce_pages(session, pages, queue, use_selenium, concurrency, errors))
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            url, title, text = item
+            page_docs.append(Document(page_content=text, metadata={"source": url, "title": title}))
+        await producer
+    finally:
+        await _stop_producer(producer)
+        if own_session:
+            await session.close()
+
+    page_docs.sort(key=lambda d: d.metadata["source"])
+    return page_docs, errors
+
+
+def crawl_pages_sync(urls, **kwargs):
+    return asyncio.run(crawl_pages(urls, **kwargs))
@@ -0,0 +1,121 @@
+# embedding_executor.py
+
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import random
+import time
+import os
+
+
+EMBED_BATCH_SIZE = int(os.getenv("MIRAG_EMBED_BATCH_SIZE", "100"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("MIRAG_EMBED_MAX_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("MIRAG_EMBED_REQUESTS_PER_MINUTE", "1500"))
+EMBED_MAX_RETRIES = int(os.getenv("MIRAG_EMBED_MAX_RETRIES", "6"))
+
+
+class TokenBucket:
+    # Classic token bucket: `rate` tokens per second, bursts up to `capacity`
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    # Quota / overload errors surface differently depending on the client layer
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in (429, 503) or getattr(code, "value", None) in (429, 503):
+        return True
+    name = type(error).__name__
+    if name in ("ResourceExhausted", "ServiceUnavailable", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "quota" in message or "rate limit" in message
+
+
+# Embedding quota is per API key, so every client in the process shares one bucket
+_shared_limiter = TokenBucket(EMBED_REQUESTS_PER_MINUTE / 60.0, capacity=EMBED_MAX_CONCURRENCY)
+
+
+class BatchedEmbeddings(Embeddings):
+    # Sends embedding requests in fixed-size batches with bounded concurrency,
+    # a shared token-bucket rate limit and exponential backoff on 429s.
+    # `on_batch(texts, vectors)` fires as each batch completes, which lets the
+    # embedding cache checkpoint progress so a failed ingest resumes.
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_concurrency: int = EMBED_MAX_CONCURRENCY,
+        limiter: TokenBucket = None,
+        max_retries: int = EMBED_MAX_RETRIES,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        on_batch=None,
+    ):
+        self.underlying = underlying
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter if limiter is not None else _shared_limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_batch = on_batch
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+
+        self.requests = 0
+        self.retries = 0
+
+    def _call_with_retry(self, fn, *args):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                self.requests += 1
+                return fn(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                self.retries += 1
+
+    def _embed_batch(self, texts):
+        vectors = self._call_with_retry(self.underlying.embed_documents, texts)
+        if self.on_batch is not None:
+            self.on_batch(texts, vectors)
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                results = list(pool.map(self._embed_batch, batches))
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text):
+        return self._call_with_retry(self.underlying.embed_query, text)
+
+    def stats(self):
+        return {"requests": self.requests, "retries": self.retries}
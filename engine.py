@@ -0,0 +1,233 @@
+# engine.py
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableParallel
+from cache_utils import get_embeddings
+from index_store import get_or_build_vectorstore
+from lexical_index import hybrid_retriever
+from chunking import get_splitter
+from context_utils import CONTEXT_FETCH_K, CONTEXT_MAX_TOKENS, pack_context, packed_context
+from resources import get_chat_model, get_summary_model
+from rag_utils import prompt, chatprompt, summary_prompt, parser
+from summary_utils import HierarchicalSummarizer, CachedSummaryChain
+from metrics_utils import span
+from operator import itemgetter
+import argparse
+import json
+import time
+import sys
+import os
+
+
+SOURCE_TYPES = ("url", "pdf", "youtube", "text")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 64
+
+
+def parse_source(spec):
+    # "url:https://...", "pdf:report.pdf", "youtube:https://youtu.be/...",
+    # "text:notes.txt" or {"type": ..., "value": ...}
+    if isinstance(spec, dict):
+        kind, value = spec["type"], spec["value"]
+    else:
+        kind, _, value = spec.partition(":")
+    if kind not in SOURCE_TYPES or not value:
+        raise ValueError(f"Bad source {spec!r}, expected one of {SOURCE_TYPES} as '<type>:<value>'")
+    return kind, value
+
+
+class RAGEngine:
+    # Headless counterpart of the Streamlit tabs: ingest any mix of sources
+    # into one index, then answer questions in batches. Retrieval for a batch
+    # is one FAISS matrix search and LLM calls run with bounded concurrency.
+    # `llm` / `embeddings` default to the shared Gemini clients; pass the
+    # fake_backends ones for offline runs.
+
+    def __init__(self, llm=None, embeddings=None, concurrency: int = DEFAULT_CONCURRENCY, max_context_tokens: int = CONTEXT_MAX_TOKENS, summary_llm=None):
+        self.llm = llm or get_chat_model()
+        self.summary_llm = summary_llm or llm or get_summary_model()
+        self.embeddings = embeddings or get_embeddings()
+        self.concurrency = concurrency
+        self.max_context_tokens = max_context_tokens
+        self.splitters = {"url": get_splitter("web"), "text": get_splitter("text")}
+
+        self.vectorstore = None
+        self.retriever = None
+        self.errors = {}
+
+    def _load(self, kind: str, values):
+        if kind == "url":
+            from crawl_utils import crawl_pages_sync
+
+            pages, errors = crawl_pages_sync(values, concurrency=self.concurrency)
+            self.errors.update(errors)
+            return [chunk for page in pages for chunk in self.splitters["url"].split_documents([page])]
+        chunks = []
+        for value in values:
+            try:
+                if kind == "pdf":
+                    from pdf_utils import iter_pdf_chunks
+                    chunks.extend(iter_pdf_chunks(value, os.path.basename(value)))
+                elif kind == "youtube":
+                    from youtube_utils import extract_video_id, fetch_yt_snippets, window_transcript
+                    video_id = extract_video_id(value)
+                    if not video_id:
+                        raise ValueError("Invalid YouTube URL")
+                    chunks.extend(window_transcript(fetch_yt_snippets(video_id), video_id, source=value))
+                else:
+                    with open(value, encoding="utf-8") as f:
+                        text = f.read()
+                    chunks.extend(self.splitters["text"].split_documents([Document(page_content=text, metadata={"source": value})]))
+            except Exception as e:
+                self.errors[value] = str(e)
+        return chunks
+
+    def ingest(self, sources):
+        by_kind = {}
+        for spec in sources:
+            kind, value = parse_source(spec)
+            by_kind.setdefault(kind, []).append(value)
+
+        with span("engine.ingest", sources=len(sources)) as s:
+            chunks = []
+            for kind in SOURCE_TYPES:
+                if kind in by_kind:
+                    with span(f"load.{kind}", sources=len(by_kind[kind])) as load:
+                        loaded = self._load(kind, by_kind[kind])
+                        load.set(chunks=len(loaded))
+                    chunks.extend(loaded)
+            if not chunks:
+                raise ValueError(f"No content could be loaded: {self.errors or 'no sources given'}")
+
+            self.vectorstore = get_or_build_vectorstore(chunks, self.embeddings, source=f"engine: {len(sources)} sources")
+            self.retriever = hybrid_retriever(self.vectorstore, k=CONTEXT_FETCH_K)
+            s.set(chunks=len(chunks), errors=len(self.errors))
+        return {"sources": len(sources), "chunks": len(chunks), "errors": dict(self.errors)}
+
+    def answer_many(self, questions):
+        # -> [{"question", "answer", "sources", "error"}] in input order.
+        # Duplicate questions are answered once.
+        unique = list(dict.fromkeys(questions))
+
+        with span("engine.answer_many", questions=len(unique)):
+            if self.retriever is not None:
+                with span("retrieve_many", queries=len(unique)):
+                    retrieved = self.retriever.retrieve_many(unique, max_workers=self.concurrency)
+                inputs = [
+                    {"question": q, "memory": "", "context": pack_context(q, docs, self.max_context_tokens)}
+                    for q, docs in zip(unique, retrieved)
+                ]
+                chain = prompt | self.llm | parser
+            else:
+                retrieved = [[] for _ in unique]
+                inputs = [{"question": q, "memory": ""} for q in unique]
+                chain = chatprompt | self.llm | parser
+
+            with span("generate", prompts=len(inputs)):
+                outputs = chain.batch(inputs, config={"max_concurrency": self.concurrency}, return_exceptions=True)
+
+        results = {}
+        for q, docs, output in zip(unique, retrieved, outputs):
+            failed = isinstance(output, Exception)
+            results[q] = {
+                "question": q,
+                "answer": None if failed else output,
+                "sources": list(dict.fromkeys(doc.metadata.get("source", "") for doc in docs)),
+                "error": str(output) if failed else None,
+            }
+        return [dict(results[q]) for q in questions]
+
+    def answer(self, question: str):
+        return self.answer_many([question])[0]
+
+    def qa_chain(self):
+        # Single-question chain, {"question", "query", "memory"} -> answer, for
+        # callers that drive it themselves (e.g. server.py with ainvoke)
+        if self.retriever is None:
+            return chatprompt | self.llm | parser
+        return RunnableParallel({
+            "context": itemgetter("query") | packed_context(self.retriever, self.max_context_tokens),
+            "question": itemgetter("question"),
+            "memory": itemgetter("memory"),
+        }) | prompt | self.llm | parser
+
+    def summary_chain(self):
+        # {"context": text} -> summary; long text is condensed with `llm` first
+        return CachedSummaryChain(summary_prompt, self.summary_llm, HierarchicalSummarizer(self.llm))
+
+    def documents_text(self) -> str:
+        # Indexed chunks in index order, for summarizing a whole index
+        if self.vectorstore is None:
+            return ""
+        docs = (self.vectorstore.docstore.search(doc_id) for doc_id in self.vectorstore.index_to_docstore_id.values())
+        return "\n\n".join(doc.page_content for doc in docs if isinstance(doc, Document))
+
+
+def _read_questions(path: str):
+    # JSONL of {"id": ..., "question": ...} (extra keys are passed through)
+    # or plain strings; blank lines are skipped
+    with open(path, encoding="utf-8") if path != "-" else sys.stdin as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            record.setdefault("id", n)
+            yield record
+
+
+def _batches(records, size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions over a set of sources.")
+    parser.add_argument("--source", action="append", default=[], help="<type>:<value> with type one of url, pdf, youtube, text (repeatable)")
+    parser.add_argument("--questions", required=True, help="Input JSONL, or - for stdin")
+    parser.add_argument("--output", default="-", help="Output JSONL, or - for stdout")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--fake", action="store_true", help="Use the offline fake LLM and embeddings")
+    args = parser.parse_args()
+
+    llm = embeddings = None
+    if args.fake:
+        from fake_backends import EchoChatModel, HashEmbeddings
+        llm, embeddings = EchoChatModel(), HashEmbeddings()
+
+    engine = RAGEngine(llm=llm, embeddings=embeddings, concurrency=args.concurrency)
+    if args.source:
+        stats = engine.ingest(args.source)
+        print(f"Indexed {stats['chunks']} chunks from {stats['sources']} sources", file=sys.stderr)
+        for source, error in stats["errors"].items():
+            print(f"Skipped {source}: {error}", file=sys.stderr)
+
+    start, answered, failed = time.perf_counter(), 0, 0
+    out = open(args.output, "w", encoding="utf-8") if args.output != "-" else sys.stdout
+    try:
+        for batch in _batches(_read_questions(args.questions), args.batch_size):
+            results = engine.answer_many([record["question"] for record in batch])
+            for record, result in zip(batch, results):
+                out.write(json.dumps({**record, **result}, ensure_ascii=False) + "\n")
+                failed += result["error"] is not None
+            out.flush()
+            answered += len(batch)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Answered {answered} questions ({failed} failed) in {elapsed:.1f}s, {answered / max(elapsed, 1e-9):.1f}/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
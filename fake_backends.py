@@ -0,0 +1,111 @@
+# fake_backends.py
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import numpy as np
+import hashlib
+import time
+
+
+class EchoChatModel(BaseChatModel):
+    # Deterministic offline stand-in for Gemini: answers with the last
+    # `max_words` words of the prompt, optionally after a fixed delay.
+    max_words: int = 60
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo-fake"
+
+    def _reply(self, messages) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        words = str(messages[-1].content).split()
+        return " ".join(words[-self.max_words:])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._reply(messages).split()
+        for i, word in enumerate(words):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class HashEmbeddings(Embeddings):
+    # Deterministic offline embeddings: bag of hashed words, L2-normalized,
+    # so texts sharing words land close together. `latency` is charged per
+    # call to mimic an embedding API round-trip.
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f"hash-{size}"
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in text.lower().split():
+            h = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector[h % self.size] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class TimeoutException(Exception):
+    # Same name as selenium's, which is what render_pool checks for
+    pass
+
+
+class FakeBrowser:
+    # Driver-shaped stand-in for headless Chrome: fetches pages over plain
+    # HTTP (no JavaScript), after a fixed browser startup delay.
+
+    def __init__(self, page_timeout: float, startup_seconds: float = 0.0):
+        if startup_seconds:
+            time.sleep(startup_seconds)
+        self.page_timeout = page_timeout
+        self.page_source = ""
+        self.title = ""
+
+    def get(self, url: str):
+        import requests
+        import re
+        try:
+            response = requests.get(url, timeout=self.page_timeout)
+        except requests.Timeout:
+            raise TimeoutException(url)
+        response.raise_for_status()
+        self.page_source = response.text
+        match = re.search(r"<title>(.*?)</title>", response.text, re.IGNORECASE | re.DOTALL)
+        self.title = match.group(1).strip() if match else ""
+
+    def execute_script(self, script: str):
+        return None
+
+    def quit(self):
+        pass
+
+
+def fake_browser(page_timeout: float, startup_seconds: float = 0.0):
+    # driver_factory for render_pool.RenderPool
+    return FakeBrowser(page_timeout, startup_seconds)
@@ -0,0 +1,104 @@
+# index_factory.py
+
+import numpy as np
+import faiss
+import math
+import os
+
+
+# "auto" picks by corpus size; any other value forces that mode everywhere
+INDEX_MODE = os.getenv("MIRAG_INDEX_MODE", "auto")
+INDEX_MODES = ("flat", "hnsw", "ivf", "ivfpq")
+
+HNSW_M = 32
+HNSW_EF_SEARCH = 128
+IVF_NPROBE_FRACTION = 1 / 16
+TRAIN_SAMPLE_SIZE = 50000
+PQ_NBITS = 8
+# k-means needs at least one training vector per PQ centroid
+PQ_MIN_VECTORS = 2 ** PQ_NBITS
+
+# Corpus-size thresholds for auto mode
+HNSW_MIN_VECTORS = 20000
+IVF_MIN_VECTORS = 200000
+IVFPQ_MIN_VECTORS = 1000000
+
+
+def choose_index_mode(n: int, mode: str = None) -> str:
+    mode = mode or INDEX_MODE
+    if mode != "auto":
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Unknown index mode {mode!r}, expected one of {INDEX_MODES} or 'auto'")
+        # A forced PQ mode cannot train on a small corpus; IVF alone can
+        if mode == "ivfpq" and n < PQ_MIN_VECTORS:
+            return "ivf"
+        return mode
+    if n >= IVFPQ_MIN_VECTORS:
+        return "ivfpq"
+    if n >= IVF_MIN_VECTORS:
+        return "ivf"
+    if n >= HNSW_MIN_VECTORS:
+        return "hnsw"
+    return "flat"
+
+
+def _ivf_lists(n: int) -> int:
+    # ~4*sqrt(n) lists, with enough points per list to train on
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # Largest divisor of dim giving sub-vectors of at least 8 dimensions
+    for m in range(dim // 8, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def make_index(dim: int, n: int, mode: str = None):
+    mode = choose_index_mode(n, mode)
+    if mode == "flat":
+        return faiss.IndexFlatL2(dim)
+    if mode == "hnsw":
+        return faiss.IndexHNSWFlat(dim, HNSW_M)
+    nlist = _ivf_lists(n)
+    quantizer = faiss.IndexFlatL2(dim)
+    if mode == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), PQ_NBITS)
+
+
+def tune_index(index):
+    # Search-time knobs are not serialized, so apply them after every load
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = max(1, int(ivf.nlist * IVF_NPROBE_FRACTION))
+    except RuntimeError:
+        pass
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def build_index(vectors, mode: str = None, seed: int = 0):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index = make_index(dim, n, mode)
+    if not index.is_trained:
+        sample = vectors
+        if n > TRAIN_SAMPLE_SIZE:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(n, TRAIN_SAMPLE_SIZE, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return tune_index(index)
+
+
+def compact_index(index, mode: str = None):
+    # Rebuild a flat index into the mode suited to its size; other index
+    # types (already compacted) are returned unchanged
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal == 0:
+        return index
+    if choose_index_mode(index.ntotal, mode) == "flat":
+        return index
+    return build_index(index.reconstruct_n(0, index.ntotal), mode)
@@ -0,0 +1,299 @@
+# index_store.py
+
+from cache_utils import CACHE_DIR, text_hash
+from metrics_utils import span
+from lexical_index import BM25Index, attach_lexical_index, get_lexical_index
+import threading
+import argparse
+import weakref
+import hashlib
+import pickle
+import shutil
+import json
+import time
+import os
+
+
+INDEX_DIR = os.getenv("MIRAG_INDEX_DIR", os.path.join(CACHE_DIR, "indexes"))
+# web_index's mutable per-URL indexes, loaded, listed and evicted as "live/<name>"
+LIVE_INDEX_DIR = os.path.join(INDEX_DIR, "live")
+
+# FAISS and the LangChain wrapper are imported on first use, not at startup
+
+# key -> FAISS vectorstore, shared read-only by every session of the server
+_loaded = {}
+_loaded_lock = threading.Lock()
+_build_locks = {}
+# vectorstore -> identity key, for stores loaded here or tagged by other modules
+_keys = weakref.WeakKeyDictionary()
+
+
+def embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model", type(embeddings).__name__)
+
+
+def index_key(documents, model: str) -> str:
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for doc in documents:
+        digest.update(text_hash(doc.page_content).encode("ascii"))
+        digest.update(json.dumps(doc.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(INDEX_DIR, key)
+
+
+def _read_meta(path: str):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def save_index(key: str, vectorstore, source: str = "", index_mode: str = None):
+    path = _index_path(key)
+    if os.path.isdir(path):
+        return path
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp_path, exist_ok=True)
+
+    import faiss
+    from index_factory import compact_index
+
+    try:
+        # Flat indexes built during ingestion are stored as IVF/HNSW/PQ once large enough
+        index = compact_index(vectorstore.index, index_mode)
+        faiss.write_index(index, os.path.join(tmp_path, "index.faiss"))
+        with open(os.path.join(tmp_path, "docstore.pkl"), "wb") as f:
+            pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+        get_lexical_index(vectorstore).save(os.path.join(tmp_path, "lexical.pkl"))
+
+        now = time.time()
+        meta = {
+            "key": key,
+            "source": source,
+            "chunks": index.ntotal,
+            "index_type": type(index).__name__,
+            "created": now,
+            "last_used": now,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Publish atomically; another process may have won the race
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def touch_index(path: str):
+    meta_path = os.path.join(path, "meta.json")
+    try:
+        meta = _read_meta(path)
+        meta["last_used"] = time.time()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    except (OSError, ValueError):
+        pass
+
+
+def load_index(key: str, embeddings):
+    # Live indexes are edited in place and owned by web_index
+    if key.startswith("live/"):
+        from web_index import load_live_index
+        return load_live_index(key[len("live/"):], embeddings)
+
+    with _loaded_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+    path = _index_path(key)
+    if not os.path.isdir(path):
+        return None
+
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from index_factory import tune_index
+
+    # Map flat codes straight from disk when the FAISS build supports it
+    mmap_flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = tune_index(faiss.read_index(os.path.join(path, "index.faiss"), mmap_flags))
+    with open(os.path.join(path, "docstore.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    lexical_path = os.path.join(path, "lexical.pkl")
+    if os.path.exists(lexical_path):
+        attach_lexical_index(vectorstore, BM25Index.load(lexical_path))
+    touch_index(path)
+
+    with _loaded_lock:
+        vectorstore = _loaded.setdefault(key, vectorstore)
+        _keys[vectorstore] = key
+        return vectorstore
+
+
+def is_stored(key: str) -> bool:
+    return os.path.isdir(_index_path(key))
+
+
+def unload_index(key: str):
+    # Forget the in-memory copy; the next load_index maps it from disk again
+    if key.startswith("live/"):
+        from web_index import unload_live_index
+        return unload_live_index(key[len("live/"):])
+    with _loaded_lock:
+        return _loaded.pop(key, None) is not None
+
+
+def get_or_build_vectorstore(documents, embeddings, source: str = "", index_mode: str = None):
+    # One build per unique (model, chunks) and one mmap'd copy per process
+    with span("index.build", chunks=len(documents)) as s:
+        key = index_key(documents, embedding_model_name(embeddings))
+
+        vectorstore = load_index(key, embeddings)
+        if vectorstore is not None:
+            s.set(loaded=True)
+            return vectorstore
+
+        with _loaded_lock:
+            build_lock = _build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            vectorstore = load_index(key, embeddings)
+            s.set(loaded=vectorstore is not None)
+            if vectorstore is None:
+                from langchain_community.vectorstores import FAISS
+                built = FAISS.from_documents(documents, embeddings)
+                save_index(key, built, source, index_mode)
+                vectorstore = load_index(key, embeddings)
+
+        with _loaded_lock:
+            _build_locks.pop(key, None)
+        return vectorstore
+
+
+def vectorstore_key(vectorstore):
+    with _loaded_lock:
+        return _keys.get(vectorstore)
+
+
+def set_vectorstore_key(vectorstore, key: str):
+    # Mutable stores re-tag themselves after each change so caches keyed on
+    # index identity never serve answers computed against older content
+    with _loaded_lock:
+        _keys[vectorstore] = key
+
+
+# --- Admin helpers ---
+
+def _index_names():
+    for name in os.listdir(INDEX_DIR):
+        if os.path.join(INDEX_DIR, name) == LIVE_INDEX_DIR:
+            yield from (f"live/{live}" for live in os.listdir(LIVE_INDEX_DIR))
+        else:
+            yield name
+
+
+def list_indexes():
+    if not os.path.isdir(INDEX_DIR):
+        return []
+
+    entries = []
+    for name in _index_names():
+        path = _index_path(name)
+        if ".tmp-" in name or not os.path.isdir(path):
+            continue
+        try:
+            meta = _read_meta(path)
+        except (OSError, ValueError):
+            continue
+        meta["size_bytes"] = _dir_size(path)
+        with _loaded_lock:
+            meta["loaded"] = name in _loaded
+        entries.append(meta)
+
+    return sorted(entries, key=lambda m: m["last_used"], reverse=True)
+
+
+def evict_index(key: str):
+    unload_index(key)
+    shutil.rmtree(_index_path(key), ignore_errors=True)
+
+
+def evict_indexes(max_age_seconds: float = None, max_total_bytes: int = None):
+    # Drop indexes unused for longer than max_age_seconds, then the least
+    # recently used ones until the store fits into max_total_bytes.
+    evicted = []
+    now = time.time()
+    entries = list_indexes()
+
+    if max_age_seconds is not None:
+        for meta in entries:
+            if now - meta["last_used"] > max_age_seconds:
+                evict_index(meta["key"])
+                evicted.append(meta["key"])
+        entries = [m for m in entries if m["key"] not in evicted]
+
+    if max_total_bytes is not None:
+        total = sum(m["size_bytes"] for m in entries)
+        for meta in reversed(entries):
+            if total <= max_total_bytes:
+                break
+            evict_index(meta["key"])
+            evicted.append(meta["key"])
+            total -= meta["size_bytes"]
+
+    return evicted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and evict stored MiRAG indexes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List stored indexes, most recently used first")
+    evict = sub.add_parser("evict", help="Evict indexes by age and/or total size")
+    evict.add_argument("--max-age-days", type=float, default=None)
+    evict.add_argument("--max-total-mb", type=float, default=None)
+    evict.add_argument("--key", default=None, help="Evict a single index by key")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for meta in list_indexes():
+            print(
+                f"{meta['key']}  {meta['chunks']:>7} chunks  "
+                f"{meta['size_bytes'] / 1e6:>9.2f} MB  "
+                f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['last_used']))}  "
+                f"{meta['source']}"
+            )
+    elif args.key:
+        evict_index(args.key)
+        print(f"Evicted {args.key}")
+    else:
+        evicted = evict_indexes(
+            max_age_seconds=args.max_age_days * 86400 if args.max_age_days is not None else None,
+            max_total_bytes=int(args.max_total_mb * 1e6) if args.max_total_mb is not None else None,
+        )
+        print(f"Evicted {len(evicted)} index(es)")
+
+
+if __name__ == "__main__":
+    main()
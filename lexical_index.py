@@ -0,0 +1,343 @@
+# lexical_index.py
+
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from metrics_utils import span
+import numpy as np
+import contextvars
+import threading
+import weakref
+import pickle
+import math
+import re
+
+
+TOKEN_PATTERN = re.compile(r"\w[\w\-:.]*\w|\w")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or "
+    "that the this to was were what when where which who why will with you".split()
+)
+
+
+# (embeddings, query, vector) already computed for this request, e.g. by the
+# answer cache, so the vector search does not embed the same query again
+_query_vector = contextvars.ContextVar("mirag_query_vector", default=None)
+
+
+def share_query_vector(embeddings, query: str, vector):
+    # -> token for _query_vector.reset
+    return _query_vector.set((embeddings, query, vector))
+
+
+def reset_query_vector(token, previous=None):
+    try:
+        _query_vector.reset(token)
+    except ValueError:
+        # Generator resumed in another context; just restore the previous value
+        _query_vector.set(previous)
+
+
+def known_query_vector(embeddings, query: str):
+    known = _query_vector.get()
+    if known is not None and known[0] is embeddings and known[1] == query:
+        return known[2]
+    return None
+
+
+def tokenize(text: str):
+    # Keeps codes like "e-1234", "v2.5" and timestamps like "12:34" as single terms
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    # In-process inverted index with Okapi BM25 scoring. Documents are keyed
+    # by their docstore id so results line up with the FAISS index. Scoring
+    # is vectorized: each document owns a row, and per-term (rows, tf) arrays
+    # are built lazily from the postings and dropped when a term changes.
+    # Per-term BM25 weights are cached until any document is added or removed.
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self.doc_terms = {}                 # doc_id -> {term: term frequency}
+        self.doc_length = {}                # doc_id -> number of terms
+        self.total_length = 0
+        self._rows = {}                     # doc_id -> row in the scoring arrays
+        self._row_ids = []                  # row -> doc_id, None once removed
+        self._lengths = np.zeros(1024)      # row -> document length
+        self._term_arrays = {}              # term -> (rows, term frequencies)
+        self._term_weights = {}             # term -> (rows, BM25 weights), for the current documents
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def _insert(self, doc_id: str, counts):
+        if doc_id in self.doc_terms:
+            self._remove(doc_id)
+        length = sum(counts.values())
+        self.doc_terms[doc_id] = counts
+        self.doc_length[doc_id] = length
+        self.total_length += length
+
+        self._term_weights.clear()
+        row = len(self._row_ids)
+        if row == len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths))])
+        self._rows[doc_id] = row
+        self._row_ids.append(doc_id)
+        self._lengths[row] = length
+
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+            self._term_arrays.pop(term, None)
+
+    def add(self, doc_id: str, text: str):
+        counts = defaultdict(int)
+        for term in tokenize(text):
+            counts[term] += 1
+        with self._lock:
+            self._insert(doc_id, dict(counts))
+
+    def add_many(self, doc_ids, texts):
+        for doc_id, text in zip(doc_ids, texts):
+            self.add(doc_id, text)
+
+    def _remove(self, doc_id: str):
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self.total_length -= self.doc_length.pop(doc_id)
+        self._term_weights.clear()
+        row = self._rows.pop(doc_id)
+        self._row_ids[row] = None
+        self._lengths[row] = 0
+        for term in counts:
+            self._term_arrays.pop(term, None)
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        # Rows are not reused; renumber once most of them are dead
+        if len(self._row_ids) > 1024 and len(self._row_ids) > 2 * len(self._rows):
+            self._compact()
+
+    def _compact(self):
+        self._row_ids = [doc_id for doc_id in self._row_ids if doc_id is not None]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        self._lengths = np.zeros(max(1024, 2 * len(self._row_ids)))
+        for row, doc_id in enumerate(self._row_ids):
+            self._lengths[row] = self.doc_length[doc_id]
+        self._term_arrays.clear()
+        self._term_weights.clear()
+
+    def remove(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _term_rows(self, term: str):
+        arrays = self._term_arrays.get(term)
+        if arrays is None:
+            docs = self.postings.get(term)
+            if not docs:
+                return None
+            arrays = (
+                np.fromiter((self._rows[doc_id] for doc_id in docs), dtype=np.int64, count=len(docs)),
+                np.fromiter(docs.values(), dtype=np.float64, count=len(docs)),
+            )
+            self._term_arrays[term] = arrays
+        return arrays
+
+    def _weights(self, term: str):
+        weights = self._term_weights.get(term)
+        if weights is None:
+            arrays = self._term_rows(term)
+            if arrays is None:
+                return None
+            rows, tfs = arrays
+            n = len(self.doc_terms)
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            length_norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / (self.total_length / n))
+            weights = idf * tfs * (self.k1 + 1) / (tfs + length_norm)
+            weights = self._term_weights[term] = (rows, weights, float(weights.max()))
+        return weights
+
+    def max_score(self, terms) -> float:
+        # Upper bound on any document's score for these (tokenized) terms
+        with self._lock:
+            if not self.doc_terms:
+                return 0.0
+            return sum(weights[2] for weights in map(self._weights, terms) if weights is not None)
+
+    def search(self, query: str, k: int = 10, allowed=None, terms=None):
+        # `allowed`: optional set of doc ids to restrict the search to;
+        # `terms`: the query already tokenized, when searching many indexes
+        if terms is None:
+            terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n = len(self.doc_terms)
+            if not n or not terms:
+                return []
+            # Skip the scoring arrays when no term occurs here (collections
+            # search many small indexes per question)
+            matches = [weights for weights in map(self._weights, terms) if weights is not None]
+            if not matches:
+                return []
+            size = len(self._row_ids)
+            scores = np.zeros(size)
+            for rows, weights, _ in matches:
+                scores[rows] += weights
+
+            if allowed is not None:
+                mask = np.zeros(size, dtype=bool)
+                mask[[self._rows[doc_id] for doc_id in allowed if doc_id in self._rows]] = True
+                scores[~mask] = 0
+
+            matched = np.flatnonzero(scores)
+            if len(matched) > k:
+                kth = -np.partition(-scores[matched], k - 1)[k - 1]
+                matched = matched[scores[matched] >= kth]
+            # Highest score first, ties in insertion order
+            matched = matched[np.lexsort((matched, -scores[matched]))][:k]
+            return [(self._row_ids[row], float(scores[row])) for row in matched]
+
+    def covers(self, doc_id: str, query: str) -> bool:
+        terms = self.doc_terms.get(doc_id, {})
+        return all(term in terms for term in tokenize(query))
+
+    def save(self, path: str):
+        with self._lock, open(path, "wb") as f:
+            pickle.dump({"k1": self.k1, "b": self.b, "doc_terms": self.doc_terms}, f)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index = cls(k1=state["k1"], b=state["b"])
+        for doc_id, counts in state["doc_terms"].items():
+            index._insert(doc_id, counts)
+        return index
+
+    @classmethod
+    def from_docstore(cls, vectorstore):
+        index = cls()
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                index.add(doc_id, doc.page_content)
+        return index
+
+
+# vectorstore -> BM25Index kept next to it
+_lexical = weakref.WeakKeyDictionary()
+_lexical_lock = threading.Lock()
+
+
+def attach_lexical_index(vectorstore, index: BM25Index):
+    with _lexical_lock:
+        _lexical[vectorstore] = index
+    return index
+
+
+def get_lexical_index(vectorstore, build: bool = True):
+    # Stores built before hybrid retrieval existed get an index on first use
+    with _lexical_lock:
+        index = _lexical.get(vectorstore)
+    if index is None and build:
+        index = attach_lexical_index(vectorstore, BM25Index.from_docstore(vectorstore))
+    return index
+
+
+class HybridRetriever(BaseRetriever):
+    # Fuses BM25 and FAISS rankings with reciprocal rank fusion. When the
+    # best lexical hit contains every query term and clearly beats the
+    # runner-up, the vector search (and its query embedding call) is skipped.
+
+    vectorstore: Any
+    lexical: Any
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
+    confidence_margin: float = 1.5
+
+    def _lexical_is_confident(self, query: str, hits) -> bool:
+        if not hits or not self.lexical.covers(hits[0][0], query):
+            return False
+        if len(hits) == 1:
+            return True
+        return hits[0][1] >= self.confidence_margin * hits[1][1]
+
+    def _fuse(self, hits, vector_docs):
+        fused = defaultdict(float)
+        for rank, doc in enumerate(vector_docs):
+            fused[doc.id] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, (doc_id, _) in enumerate(hits):
+            fused[doc_id] += 1.0 / (self.rrf_k + rank + 1)
+        return sorted(fused, key=fused.get, reverse=True)[:self.k]
+
+    def _resolve(self, ranked, docs):
+        results = []
+        for doc_id in ranked:
+            doc = docs.get(doc_id) or self.vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                results.append(doc)
+        return results
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        with span("retrieve") as s:
+            hits = self.lexical.search(query, self.fetch_k)
+
+            if self._lexical_is_confident(query, hits):
+                s.set(lexical_only=True)
+                results = self._resolve([doc_id for doc_id, _ in hits[:self.k]], {})
+            else:
+                vector = known_query_vector(self.vectorstore.embeddings, query)
+                s.set(lexical_only=False, query_vector_reused=vector is not None)
+                if vector is not None:
+                    vector_docs = self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+                else:
+                    vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+                docs = {doc.id: doc for doc in vector_docs if doc.id}
+                results = self._resolve(self._fuse(hits, vector_docs), docs)
+            s.set(chunks=len(results))
+            return results
+
+    def retrieve_many(self, queries, max_workers: int = 8):
+        # Batch form for bulk jobs: query embeddings run concurrently and all
+        # vector searches go to FAISS as one matrix search
+        hits = [self.lexical.search(query, self.fetch_k) for query in queries]
+        pending = [i for i, query in enumerate(queries) if not self._lexical_is_confident(query, hits[i])]
+
+        vector_docs = {}
+        if pending:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                vectors = list(pool.map(self.vectorstore.embeddings.embed_query, [queries[i] for i in pending]))
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if getattr(self.vectorstore, "_normalize_L2", False):
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            _, rows = self.vectorstore.index.search(matrix, self.fetch_k)
+            for i, row in zip(pending, rows):
+                doc_ids = [self.vectorstore.index_to_docstore_id[j] for j in row if j != -1]
+                vector_docs[i] = [
+                    doc for doc in (self.vectorstore.docstore.search(doc_id) for doc_id in doc_ids)
+                    if isinstance(doc, Document)
+                ]
+
+        results = []
+        for i, query in enumerate(queries):
+            if i in vector_docs:
+                results.append(self._resolve(self._fuse(hits[i], vector_docs[i]), {}))
+            else:
+                results.append(self._resolve([doc_id for doc_id, _ in hits[i][:self.k]], {}))
+        return results
+
+
+def hybrid_retriever(vectorstore, k: int = 3, fetch_k: int = 10):
+    return HybridRetriever(vectorstore=vectorstore, lexical=get_lexical_index(vectorstore), k=k, fetch_k=fetch_k)
@@ -0,0 +1,140 @@
+# memory_utils.py
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from cache_utils import get_summary_cache, text_hash
+from context_utils import estimate_tokens
+import threading
+import re
+
+
+MEMORY_MAX_TOKENS = 600
+SUMMARY_MAX_TOKENS = 250
+QUERY_MAX_CHARS = 400
+RECENT_ANSWER_CHARS = 800
+
+# Questions that lean on earlier turns ("what about it?", "and the second one?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|there|"
+    r"above|previous|earlier|same|more|also|else|one|ones|again)\b",
+    re.IGNORECASE,
+)
+
+fold_prompt = PromptTemplate(
+    template="""Update the running summary of a conversation with the new exchange. Keep names, numbers and open questions; drop pleasantries. Reply with the updated summary only, at most {max_words} words.
+
+Current summary:
+{summary}
+
+New exchange:
+Q: {question}
+A: {answer}
+
+Updated summary:""",
+    input_variables=["summary", "question", "answer", "max_words"],
+)
+
+rewrite_prompt = PromptTemplate(
+    template="""Rewrite the follow-up question as one standalone search query that can be understood without the conversation. Reply with the query only.
+
+Conversation:
+{conversation}
+
+Follow-up question: {question}
+
+Standalone query:""",
+    input_variables=["conversation", "question"],
+)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+
+class ConversationMemory:
+    # Token-bounded memory for one chat. Recent turns are kept verbatim
+    # (answers clipped); older turns are folded one at a time into a running
+    # summary, so the prompt stays under `max_tokens` however long the chat
+    # gets. Follow-up questions are rewritten into a standalone retrieval
+    # query instead of embedding the whole history.
+
+    def __init__(self, llm, max_tokens: int = MEMORY_MAX_TOKENS, summary_max_tokens: int = SUMMARY_MAX_TOKENS, cache=None):
+        self.fold_chain = fold_prompt | llm | StrOutputParser()
+        self.rewrite_chain = rewrite_prompt | llm | StrOutputParser()
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.cache = cache if cache is not None else get_summary_cache()
+
+        self.summary = ""
+        self.recent = []          # [(question, clipped answer)]
+        self._rewrites = {}       # (memory hash, question) -> standalone query
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.recent) + (1 if self.summary else 0)
+
+    def _recent_text(self) -> str:
+        return "\n\n".join(f"Q: {q}\nA: {a}" for q, a in self.recent)
+
+    def _fold(self, question: str, answer: str):
+        # Incremental: only the current summary and one turn go to the model
+        key = "memory:" + text_hash(f"{self.summary}\x00{question}\x00{answer}")
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = self.fold_chain.invoke({
+                "summary": self.summary or "(empty)",
+                "question": question,
+                "answer": _truncate(answer, RECENT_ANSWER_CHARS * 2),
+                "max_words": int(self.summary_max_tokens * 0.75),
+            }).strip()
+            self.cache.put(key, summary)
+        self.summary = _truncate(summary, self.summary_max_tokens * 4)
+
+    def add_turn(self, question: str, answer: str):
+        with self._lock:
+            self.recent.append((question, _truncate(answer, RECENT_ANSWER_CHARS)))
+            budget = self.max_tokens - estimate_tokens(self.summary)
+            while len(self.recent) > 1 and estimate_tokens(self._recent_text()) > budget:
+                self._fold(*self.recent.pop(0))
+                budget = self.max_tokens - estimate_tokens(self.summary)
+
+    def context(self) -> str:
+        # Generation-side memory for the prompt
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation:\n{self.summary}")
+            if self.recent:
+                parts.append(f"Recent turns:\n{self._recent_text()}")
+            return "\n\n".join(parts)
+
+    def standalone_query(self, question: str) -> str:
+        # Retrieval-side query; self-contained questions are used as they are
+        if not len(self) or not FOLLOW_UP_PATTERN.search(question):
+            return question
+        with self._lock:
+            last = self.recent[-1] if self.recent else None
+            conversation = self.summary
+            if last:
+                conversation += f"\n\nQ: {last[0]}\nA: {_truncate(last[1], RECENT_ANSWER_CHARS // 2)}"
+            key = (text_hash(conversation), question)
+            if key in self._rewrites:
+                return self._rewrites[key]
+        try:
+            query = self.rewrite_chain.invoke({"conversation": conversation.strip(), "question": question}).strip()
+        except Exception:
+            return question
+        query = _truncate(query.splitlines()[0] if query else question, QUERY_MAX_CHARS)
+        with self._lock:
+            self._rewrites[key] = query
+        return query
+
+    def inputs(self, question: str):
+        # Chain input: the question, its standalone retrieval query and the memory
+        return {"question": question, "query": self.standalone_query(question), "memory": self.context()}
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.recent = []
+            self._rewrites.clear()
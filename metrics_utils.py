@@ -0,0 +1,272 @@
+# metrics_utils.py
+
+from langchain_core.callbacks import BaseCallbackHandler
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+import contextvars
+import threading
+import secrets
+import json
+import time
+import os
+
+
+MAX_SAMPLES = 1000
+MAX_SPANS = 5000
+
+# Finished spans are also appended here as JSON lines when set
+TRACE_FILE = os.getenv("MIRAG_TRACE_FILE")
+
+# metric name -> most recent samples, shared by every session of the server
+_metrics = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_metrics_lock = threading.Lock()
+
+
+def record_metric(name: str, value: float):
+    with _metrics_lock:
+        _metrics[name].append(value)
+
+
+def _percentile(values, q: float):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def metric_summary(name: str):
+    with _metrics_lock:
+        values = list(_metrics.get(name, ()))
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": _percentile(values, 0.50),
+        "p95": _percentile(values, 0.95),
+        "last": values[-1],
+    }
+
+
+def all_metrics():
+    with _metrics_lock:
+        names = sorted(_metrics)
+    return {name: metric_summary(name) for name in names}
+
+
+def prometheus_text() -> str:
+    # Prometheus text exposition of every metric as a summary
+    lines = []
+    for name, stats in all_metrics().items():
+        if stats is None:
+            continue
+        metric = "mirag_" + "".join(c if c.isalnum() else "_" for c in name)
+        lines.append(f"# TYPE {metric} summary")
+        lines.append(f'{metric}{{quantile="0.5"}} {stats["p50"]}')
+        lines.append(f'{metric}{{quantile="0.95"}} {stats["p95"]}')
+        lines.append(f"{metric}_sum {stats['mean'] * stats['count']}")
+        lines.append(f"{metric}_count {stats['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Tracing -----------------------------------------------------------------
+# Spans nest through a context variable, so a stage opened inside another
+# (also across LangChain's context-copying thread pools) becomes its child.
+# Each finished span also feeds "<name>.seconds" into the metrics above.
+
+_spans = deque(maxlen=MAX_SPANS)
+_spans_lock = threading.Lock()
+_current = contextvars.ContextVar("mirag_span", default=None)
+_trace_sink = contextvars.ContextVar("mirag_trace_sink", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.duration = None
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, key: str, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_seconds": self.duration,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def _finish(s: Span):
+    s.duration = time.perf_counter() - s._start
+    record_metric(f"{s.name}.seconds", s.duration)
+    record = s.to_dict()
+    with _spans_lock:
+        _spans.append(record)
+        if TRACE_FILE:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+    sink = _trace_sink.get()
+    if s.parent_id is None and sink is not None:
+        sink.append(s.trace_id)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current.get()
+    s = Span(name, parent, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generator resumed in another context; just restore the parent
+            _current.set(parent)
+        _finish(s)
+
+
+def traced(name: str):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attributes):
+    # Adds attributes to the innermost open span, if any
+    s = _current.get()
+    if s is not None:
+        s.set(**attributes)
+
+
+def recent_spans(trace_id: str = None):
+    with _spans_lock:
+        spans = list(_spans)
+    return [s for s in spans if trace_id is None or s["trace_id"] == trace_id]
+
+
+def collect_traces(sink: list):
+    # Trace ids of top-level spans finished later in this context (e.g. one
+    # Streamlit script run) are appended to `sink`
+    _trace_sink.set(sink)
+
+
+def trace_spans(trace_id: str):
+    # Spans of one trace, in start order
+    if trace_id is None:
+        return []
+    return sorted(recent_spans(trace_id), key=lambda s: s["start_ns"])
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans):
+    # OTLP/JSON body (POST to a collector's /v1/traces) for span dicts
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "mirag"}}]},
+        "scopeSpans": [{
+            "scope": {"name": "mirag"},
+            "spans": [{
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                **({"parentSpanId": s["parent_id"]} if s["parent_id"] else {}),
+                "name": s["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(s["start_ns"] + int((s["duration_seconds"] or 0) * 1e9)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class LLMTracingCallback(BaseCallbackHandler):
+    # Records an "llm" span per model call with time-to-first-token and the
+    # token usage Gemini reports; attach through the model's callbacks
+
+    def __init__(self):
+        self._spans = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model")
+        self._spans[run_id] = Span("llm", _current.get(), {"model": model} if model else None)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._spans[run_id] = Span("llm", _current.get())
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        s = self._spans.get(run_id)
+        if s is not None and "ttft_seconds" not in s.attributes:
+            s.set(ttft_seconds=time.perf_counter() - s._start)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        s = self._spans.pop(run_id, None)
+        if s is None:
+            return
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (AttributeError, IndexError):
+            usage = {}
+        if usage:
+            s.set(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+        _finish(s)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        s = self._spans.pop(run_id, None)
+        if s is not None:
+            s.error = repr(error)
+            _finish(s)
+
+
+llm_tracer = LLMTracingCallback()
+
+
+def timed_stream(chunks, label: str):
+    # Pass chunks through unchanged while recording time-to-first-token
+    # and total stream time under "<label>.ttft_seconds" / "<label>.total_seconds".
+    # The whole stream is one trace, with the pipeline stages as child spans.
+    with span(label) as s:
+        start = time.perf_counter()
+        first = True
+        for chunk in chunks:
+            if first:
+                ttft = time.perf_counter() - start
+                record_metric(f"{label}.ttft_seconds", ttft)
+                s.set(ttft_seconds=ttft)
+                first = False
+            yield chunk
+        record_metric(f"{label}.total_seconds", time.perf_counter() - start)
@@ -1,65 +1,275 @@
 # pdf_utils.py
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableParallel, RunnableLambda, RunnablePassthrough
-from langchain_community.vectorstores import FAISS
+from langchain_core.runnables import RunnableParallel
 
+import os
+import time
+import multiprocessing
+import hashlib
 import tempfile
-from langchain_community.document_loaders import PyPDFLoader
+import threading
+from collections import OrderedDict, deque
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from pypdf import PdfReader
+import faiss
+from cache_utils import get_embeddings
+from lexical_index import BM25Index, attach_lexical_index, get_lexical_index, hybrid_retriever
+from context_utils import CONTEXT_FETCH_K, packed_context
+from index_store import vectorstore_key, embedding_model_name, save_index, load_index, is_stored
+from answer_cache import SemanticCachedChain
+from resources import get_chat_model, get_summary_model, get_summarizer
+from chunking import get_splitter
+from metrics_utils import span
+from session_manager import get_resource_manager
+
+PDF_REGISTRY_MAX_ENTRIES = 32
+PDF_PAGES_PER_TASK = 8
+PDF_EMBED_BATCH_SIZE = 64
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+# content hash -> PdfIngestJob, shared by every session of the server. Only
+# jobs still indexing hold a store; finished ones load theirs by key.
+_pdf_registry = OrderedDict()
+_pdf_registry_lock = threading.Lock()
+
+def _extract_pages(path: str, start: int, end: int):
+    # Runs in a worker process; each worker opens its own reader
+    reader = PdfReader(path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def iter_pdf_chunks(path: str, file_name: str, workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+    # Extracts page ranges across a process pool and yields split chunks in
+    # page order. Only `2 * workers` ranges are in flight at once, so memory
+    # stays bounded no matter how many pages the document has.
+    total_pages = len(PdfReader(path).pages)
+    splitter = get_splitter("pdf")
+    ranges = deque((start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task))
+
+    # Spawned, not forked: the server forks from a process with live threads
+    # (ingest workers, the render pool's), and a fork copies their held locks
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < 2 * workers:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(_extract_pages, path, start, end))
+            for page, text in in_flight.popleft().result():
+                metadata = {"source": file_name, "page": page, "total_pages": total_pages}
+                yield from splitter.split_documents([Document(page_content=text, metadata=metadata)])
+
+
+class _GrowingFAISS(FAISS):
+    # FAISS store that may be searched while the ingest thread appends to it
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def add_embeddings(self, *args, **kwargs):
+        with self._lock:
+            return super().add_embeddings(*args, **kwargs)
+
+    def similarity_search_with_score_by_vector(self, *args, **kwargs):
+        with self._lock:
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+
+class PdfIngestJob:
+    # Streams one PDF into an index on a background thread. The first batch
+    # makes the document queryable; later pages are appended as they arrive.
+    # Once stored, the job keeps only the index key: `vectorstore` maps it
+    # back from the index store, and sessions hand it to the resource manager,
+    # which also holds the one chain built over it.
+
+    def __init__(self, data: bytes, file_hash: str, file_name: str, embeddings=None):
+        self.file_hash = file_hash
+        self.file_name = file_name
+        self.embeddings = embeddings or get_embeddings()
+        self.key = hashlib.sha256(
+            f"pdf\x00{embedding_model_name(self.embeddings)}\x00{file_hash}".encode("utf-8")
+        ).hexdigest()
+
+        self._vectorstore = None
+        self._chain = None
+        self.pages_done = 0
+        self.total_pages = 0
+        self.done = False
+        self.error = None
+        self._queryable = threading.Event()
+
+        # Already built in an earlier run: serve it straight from the index store
+        stored = load_index(self.key, self.embeddings)
+        if stored is not None:
+            self.pages_done = self.total_pages = self._page_count(stored)
+            self.done = True
+            self._queryable.set()
+            return
+
+        threading.Thread(target=self._run, args=(data,), daemon=True).start()
 
-def process_pdf(uploaded_file):
-    # Write uploaded file to a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_file_path = tmp_file.name
+    @staticmethod
+    def _page_count(vectorstore):
+        docs = vectorstore.docstore._dict.values()
+        return max((d.metadata.get("total_pages", 0) for d in docs), default=0)
 
-    # Load PDF using path
-    loader = PyPDFLoader(tmp_file_path)
-    pages = loader.load()
+    def identity(self) -> str:
+        return self.key if self.done else f"{self.key}:partial:{self.pages_done}"
 
-    # Split and return
-    # from langchain.text_splitter import RecursiveCharacterTextSplitter
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    split_docs = splitter.split_documents(pages)
+    @property
+    def vectorstore(self):
+        vectorstore = self._vectorstore
+        if vectorstore is None and self.done:
+            vectorstore = load_index(self.key, self.embeddings)
+        return vectorstore
 
-    return "\n\n".join([doc.page_content for doc in split_docs]), split_docs
+    @property
+    def chain(self):
+        chain = self._chain
+        if chain is None and self.done:
+            # Built once and kept with the index (the same chain sessions get
+            # for their "pdf" slot); dropped if the manager evicts the index
+            manager = get_resource_manager()
+            try:
+                return manager.chain(self.key, "pdf", build_pdf_index_qa_chain)
+            except LookupError:
+                pass
+            vectorstore = load_index(self.key, self.embeddings)
+            if vectorstore is None:
+                return None
+            manager.register(vectorstore, self.key)
+            chain = manager.chain(self.key, "pdf", build_pdf_index_qa_chain)
+        return chain
+
+    def _publish(self, vectorstore):
+        self._vectorstore = vectorstore
+        self._chain = _build_pdf_qa_chain(vectorstore, self.embeddings, index_id=self.identity)
+
+    def _add_batch(self, batch):
+        texts = [d.page_content for d in batch]
+        vectors = self.embeddings.embed_documents(texts)
+        if self._vectorstore is None:
+            index = faiss.IndexFlatL2(len(vectors[0]))
+            store = _GrowingFAISS(self.embeddings, index, InMemoryDocstore(), {})
+            ids = store.add_embeddings(list(zip(texts, vectors)), metadatas=[d.metadata for d in batch])
+            attach_lexical_index(store, BM25Index()).add_many(ids, texts)
+            self._publish(store)
+            self._queryable.set()
+        else:
+            ids = self._vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=[d.metadata for d in batch])
+            get_lexical_index(self._vectorstore).add_many(ids, texts)
+        self.pages_done = batch[-1].metadata["page"] + 1
+        self.total_pages = batch[-1].metadata["total_pages"]
+
+    def _run(self, data: bytes):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            tmp_file.write(data)
+            tmp_file_path = tmp_file.name
+        try:
+            with span("load.pdf", file=self.file_name) as s:
+                start = time.perf_counter()
+                batch, chunks = [], 0
+                for chunk in iter_pdf_chunks(tmp_file_path, self.file_name):
+                    batch.append(chunk)
+                    chunks += 1
+                    if len(batch) >= PDF_EMBED_BATCH_SIZE:
+                        self._add_batch(batch)
+                        batch = []
+                        if "queryable_seconds" not in s.attributes:
+                            s.set(queryable_seconds=time.perf_counter() - start)
+                if batch:
+                    self._add_batch(batch)
+                if self._vectorstore is None:
+                    raise ValueError("No extractable text found in PDF")
+                self.pages_done = self.total_pages
+                s.set(pages=self.total_pages, chunks=chunks)
+                save_index(self.key, self._vectorstore, source=self.file_name)
+                self.done = True
+                # Serve the mapped copy from now on and free the in-memory build
+                self._vectorstore = self._chain = None
+        except Exception as e:
+            self.error = e
+        finally:
+            os.remove(tmp_file_path)
+            self._queryable.set()
+
+    def wait_until_queryable(self, timeout: float = None):
+        self._queryable.wait(timeout)
+        if self.error is not None and self._vectorstore is None:
+            raise self.error
+        return self.chain
+
+    def documents(self, vectorstore=None):
+        # Chunks in page order, read back from the docstore rather than kept twice
+        vectorstore = vectorstore or self.vectorstore
+        ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+        return [vectorstore.docstore.search(doc_id) for doc_id in ids]
+
+
+def file_content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def ingest_pdf(data: bytes, file_hash: str = None, file_name: str = "uploaded.pdf"):
+    # Start (or reuse) the streaming ingest for each unique PDF
+    file_hash = file_hash or file_content_hash(data)
+
+    with _pdf_registry_lock:
+        job = _pdf_registry.get(file_hash)
+        # A failed job (even one that indexed some pages) or one whose index
+        # was evicted from disk starts over; the embedding cache makes the
+        # pages it already did cheap to redo
+        if job is None or job.error is not None or (job.done and not is_stored(job.key)):
+            job = PdfIngestJob(data, file_hash, file_name)
+            _pdf_registry[file_hash] = job
+            while len(_pdf_registry) > PDF_REGISTRY_MAX_ENTRIES:
+                _pdf_registry.popitem(last=False)
+        _pdf_registry.move_to_end(file_hash)
+
+    return job
 
 
 # PDF QA
-def build_pdf_qa_chain(docs):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    vectorstore = FAISS.from_documents(docs, embedding=embeddings)
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+def build_pdf_index_qa_chain(vectorstore):
+    # QA chain over an already built PDF index
+    return _build_pdf_qa_chain(vectorstore, vectorstore.embeddings)
+
+
+def _build_pdf_qa_chain(vectorstore, embeddings, index_id=None):
+    retriever = hybrid_retriever(vectorstore, k=CONTEXT_FETCH_K)
 
     prompt = PromptTemplate(
         template="""You are an expert assistant with deep domain knowledge. Based only on the provided context, generate a detailed, well-structured explanation that fully answers the question. If the context is insufficient to answer, just say you don't know. Use clear reasoning, relevant facts and examples from the context wherever applicable.
 
+{memory}
+
 Context:
 {context}
 
 Question: {question}
 
 Answer:""",
-        input_variables=["context", "question"]
+        input_variables=["memory", "context", "question"]
     )
 
-    model = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.2,
-        # max_output_tokens=600
-    )
+    model = get_chat_model()
 
     parser = StrOutputParser()
 
     chain = RunnableParallel({
-        "context": retriever | RunnableLambda(lambda x: "\n\n".join(doc.page_content for doc in x)),
-        "question": RunnablePassthrough()
+        "context": itemgetter("query") | packed_context(retriever),
+        "question": itemgetter("question"),
+        "memory": itemgetter("memory")
     }) | prompt | model | parser
 
-    return chain
+    index_id = index_id or vectorstore_key(vectorstore) or f"session:{id(vectorstore)}"
+    return SemanticCachedChain(chain, index_id, embeddings)
 
 # PDF Summary
 def build_pdf_summary_chain():
@@ -72,11 +282,6 @@ Summary:""",
         input_variables=["context"]
     )
 
-    summary_model = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        temperature=0.5,
-        # max_output_tokens=2500
-    )
-
-    parser = StrOutputParser()
-    return summary_prompt | summary_model | parser
+    # Sections of long PDFs are condensed with the fast model before the final pass
+    from summary_utils import CachedSummaryChain
+    return CachedSummaryChain(summary_prompt, get_summary_model(), get_summarizer())
@@ -1,65 +1,46 @@
 # rag_utils.py
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough, RunnableLambda
-from langchain_community.document_loaders import SeleniumURLLoader, WebBaseLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.runnables import RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 # from reportlab.lib.pagesizes import letter
 # from langchain.vectorstores import FAISS
 from langchain.schema import Document
 # from reportlab.pdfgen import canvas
-from dotenv import load_dotenv
 # from datetime import datetime
 from io import BytesIO
+from operator import itemgetter
 from fpdf import FPDF
+from cache_utils import get_embeddings
+from index_store import get_or_build_vectorstore, vectorstore_key
+from answer_cache import SemanticCachedChain
+from lexical_index import hybrid_retriever
+from context_utils import CONTEXT_FETCH_K, packed_context
+from memory_utils import ConversationMemory
+from chunking import get_splitter
+from resources import get_chat_model, get_summary_model, get_summarizer
+from metrics_utils import traced, annotate
 # import tempfile
-import os
 
 
-def load_with_selenium(urls):
-    loader = SeleniumURLLoader(urls=urls)
-    return loader.load()
-
-def load_with_webbase(urls):
-    loader = WebBaseLoader(web_path=urls)
-    return loader.load()
-
 def format_doc(retriever_docs):
     return "\n\n".join(doc.page_content for doc in retriever_docs)
 
-load_dotenv()
-
-google_api_key = os.getenv("GOOGLE_API_KEY")
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.2,
-    # max_output_tokens=512,
-    google_api_key = google_api_key
-)
-
-summary_model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-pro",
-    temperature=0.5,
-    google_api_key = google_api_key,
-    # max_output_tokens=2500
-)
-
 parser = StrOutputParser()
 
 prompt = PromptTemplate(
         template="""
         You are an expert assistant with deep domain knowledge. Based only on the provided context, generate a detailed, well-structured explanation that fully answers the question. If the context is insufficient to answer, just say you don't know. Use clear reasoning, relevant facts and examples from the context wherever applicable.
 
+        {memory}
+
         Context:
         {context}
 
         Question: {question}
 
         Detailed Answer:""",
-            input_variables=["context", "question"]
+            input_variables=["memory", "context", "question"]
         )
 
 summary_prompt = PromptTemplate(
@@ -73,46 +54,93 @@ summary_prompt = PromptTemplate(
             input_variables=["context"]
         )
 
+youtube_prompt = PromptTemplate(
+        template="""
+        You are an expert assistant with deep domain knowledge. Based only on the provided transcript excerpts, generate a detailed, well-structured explanation that fully answers the question. If the excerpts are insufficient to answer, just say you don't know. Each excerpt starts with its [mm:ss] position in the video; cite the positions that support your answer in the same [mm:ss] form.
+
+        {memory}
+
+        Transcript excerpts:
+        {context}
+
+        Question: {question}
+
+        Detailed Answer:""",
+            input_variables=["memory", "context", "question"]
+        )
+
 chatprompt = PromptTemplate(
         template="""
         You are a helpful and knowledgeable assistant. 
         Provide concise, accurate answers based on your understanding.
 
+        {memory}
+
         Question: {question}
         Answer:""",
-            input_variables=["question"]
+            input_variables=["memory", "question"]
         )
 
+@traced("load.web")
 def create_vectorstore_from_url(url: str, use_selenium: bool = False):
-    urls = [url]
-    docs = load_with_selenium(urls) if use_selenium else load_with_webbase(urls)
-    documents = "\n\n".join(doc.page_content for doc in docs)
+    # Reloading a URL only embeds the chunks that changed since the last load
+    from web_index import get_live_index
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    texts = splitter.split_text(documents)
+    embeddings = get_embeddings()
+    live_index = get_live_index(url, embeddings)
+    stats = live_index.refresh(use_selenium)
+    annotate(url=url, chunks=len(live_index.chunk_ids), **stats)
+    return live_index.load(), live_index.documents()
 
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    vectorstore = FAISS.from_texts(texts, embeddings)
 
-    return vectorstore, docs
+@traced("load.web_batch")
+def create_vectorstore_from_urls(urls, use_selenium: bool = False):
+    # Batch mode: many URLs and/or sitemaps fetched concurrently into one index
+    from crawl_utils import crawl_and_index_sync
 
+    embeddings = get_embeddings()
+    annotate(urls=len(urls))
+    return crawl_and_index_sync(urls, embeddings, use_selenium=use_selenium)
 
-def build_qa_chain(vectorstore = None):
-    if vectorstore is None:
-        return chatprompt | model | parser
-    
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 3})
 
+def new_conversation_memory():
+    # One per chat tab and session; summaries use the fast model
+    return ConversationMemory(get_chat_model())
+
+
+def index_identity(vectorstore):
+    return vectorstore_key(vectorstore) or f"session:{id(vectorstore)}"
+
+def _build_retrieval_qa_chain(retriever, index_id, embeddings, qa_prompt = None):
+    # Retrieval sees the standalone query, the prompt the question and memory
     parallel_chain = RunnableParallel({
-        "context": retriever | RunnableLambda(format_doc),
-        "question": RunnablePassthrough()
+        "context": itemgetter("query") | packed_context(retriever),
+        "question": itemgetter("question"),
+        "memory": itemgetter("memory")
     })
 
-    final_chain = parallel_chain | prompt | model | parser
-    return final_chain
+    final_chain = parallel_chain | (qa_prompt or prompt) | get_chat_model() | parser
+    return SemanticCachedChain(final_chain, index_id, embeddings)
+
+def build_qa_chain(vectorstore = None, qa_prompt = None):
+    if vectorstore is None:
+        model = get_chat_model()
+        return SemanticCachedChain(chatprompt | model | parser, f"chat:{model.model}", get_embeddings())
+
+    # Over-fetch, then rerank and pack to a token budget instead of a fixed top 3
+    retriever = hybrid_retriever(vectorstore, k=CONTEXT_FETCH_K)
+    # Resolved per question: live web indexes change identity when refreshed in place
+    return _build_retrieval_qa_chain(retriever, lambda: index_identity(vectorstore), vectorstore.embeddings, qa_prompt)
+
+def build_collection_qa_chain(collection, sources = None, types = None):
+    # Questions across every source loaded in the session, optionally
+    # restricted to some sources / source types
+    retriever = collection.retriever(k=CONTEXT_FETCH_K, sources=sources, types=types)
+    return _build_retrieval_qa_chain(retriever, lambda: collection.identity(sources, types), collection.embeddings)
 
 def build_summary_chain():
-    return summary_prompt | summary_model | parser
+    from summary_utils import CachedSummaryChain
+    return CachedSummaryChain(summary_prompt, get_summary_model(), get_summarizer())
 
 
 def generate_chat_pdf_buffer(chat_history):
@@ -131,10 +159,10 @@ def generate_chat_pdf_buffer(chat_history):
     pdf_bytes = pdf.output(dest='S').encode('latin-1')
     return BytesIO(pdf_bytes)
 
+@traced("load.text")
 def create_vectorstore_from_text(text: str):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    docs = splitter.split_text(text)
-    wrapped_docs = [Document(page_content=d) for d in docs]
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    vectorstore = FAISS.from_documents(wrapped_docs, embeddings)
+    wrapped_docs = get_splitter("text").split_documents([Document(page_content=text)])
+    annotate(chars=len(text), chunks=len(wrapped_docs))
+    embeddings = get_embeddings()
+    vectorstore = get_or_build_vectorstore(wrapped_docs, embeddings, source="custom text")
     return vectorstore
@@ -0,0 +1,179 @@
+# render_pool.py
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing.util
+import threading
+import atexit
+import time
+import os
+
+
+RENDER_WORKERS = int(os.getenv("MIRAG_RENDER_WORKERS", "2"))
+PAGE_TIMEOUT_SECONDS = 30
+PAGES_PER_BROWSER = 50      # a browser is restarted after this many pages to cap its memory
+
+# Requests Chrome never makes while rendering: text extraction needs none of them
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav",
+]
+
+
+def chrome_driver(page_timeout: float):
+    # Headless Chrome with images, fonts and media blocked
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    for argument in ("--headless=new", "--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu",
+                     "--disable-extensions", "--blink-settings=imagesEnabled=false"):
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(page_timeout)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    return driver
+
+
+# --- Worker process side ---
+# Each worker keeps one browser open between jobs and restarts it after
+# `pages_per_browser` pages or after it fails.
+
+_worker = {"driver": None, "pages": 0}
+
+
+def _init_worker(driver_factory, page_timeout: float, pages_per_browser: int):
+    _worker.update(factory=driver_factory, page_timeout=page_timeout, pages_per_browser=pages_per_browser)
+    # Pool workers skip atexit; multiprocessing finalizers still run
+    multiprocessing.util.Finalize(None, _close_browser, exitpriority=10)
+
+
+def _close_browser():
+    driver, _worker["driver"] = _worker["driver"], None
+    _worker["pages"] = 0
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+def _render(url: str):
+    start = time.perf_counter()
+    started = _worker["driver"] is None
+    if started:
+        _worker["driver"] = _worker["factory"](_worker["page_timeout"])
+    driver = _worker["driver"]
+
+    timed_out = False
+    try:
+        try:
+            driver.get(url)
+        except Exception as e:
+            # selenium's TimeoutException, matched by name so other drivers need no selenium
+            if type(e).__name__ != "TimeoutException":
+                raise
+            # Keep whatever rendered before the deadline
+            timed_out = True
+            driver.execute_script("window.stop();")
+        html, title = driver.page_source, driver.title
+    except Exception:
+        _close_browser()
+        raise
+
+    _worker["pages"] += 1
+    if _worker["pages"] >= _worker["pages_per_browser"]:
+        _close_browser()
+    return {
+        "url": url, "html": html, "title": title, "timed_out": timed_out,
+        "browser_started": started, "seconds": time.perf_counter() - start,
+    }
+
+
+# --- Parent side ---
+
+class RenderPool:
+    # Warm headless browsers in worker processes. Jobs wait in the executor's
+    # queue until a worker is free; single-URL and batch loads share it.
+    # `driver_factory(page_timeout)` must be picklable (a module-level
+    # function or a functools.partial of one); fake_backends.fake_browser
+    # renders local fixtures without a browser. If a worker process dies,
+    # the pool is started again on the next submit.
+
+    def __init__(self, workers: int = RENDER_WORKERS, driver_factory=chrome_driver,
+                 page_timeout: float = PAGE_TIMEOUT_SECONDS, pages_per_browser: int = PAGES_PER_BROWSER):
+        self.page_timeout = page_timeout
+        self.workers = workers
+        self._initargs = (driver_factory, page_timeout, pages_per_browser)
+        self._executor = self._start()
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "rendered": 0, "failed": 0, "timed_out": 0, "browser_starts": 0,
+                       "render_seconds": 0.0, "pool_restarts": 0}
+
+    def _start(self):
+        # Spawned, not forked: a fork would copy the locks held by the
+        # server's other threads (and _record's) into every worker
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=self._initargs)
+
+    def _record(self, future):
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self._stats["failed"] += 1
+                return
+            page = future.result()
+            self._stats["rendered"] += 1
+            self._stats["timed_out"] += page["timed_out"]
+            self._stats["browser_starts"] += page["browser_started"]
+            self._stats["render_seconds"] += page["seconds"]
+
+    def submit(self, url: str):
+        # -> Future of {"url", "html", "title", "timed_out", "browser_started", "seconds"}
+        with self._lock:
+            self._stats["submitted"] += 1
+            try:
+                future = self._executor.submit(_render, url)
+            except BrokenProcessPool:
+                # A worker died (e.g. a browser crash took it down); futures
+                # of the old pool have already failed, start a fresh one
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+                self._stats["pool_restarts"] += 1
+                future = self._executor.submit(_render, url)
+        future.add_done_callback(self._record)
+        return future
+
+    def render(self, url: str):
+        return self.submit(url).result()
+
+    def render_many(self, urls):
+        # -> results in input order; a failed page is its exception instead
+        futures = [self.submit(url) for url in urls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def get_render_pool():
+    # One pool for the whole server process, started on first use
+    from resources import shared
+
+    def build():
+        pool = RenderPool()
+        atexit.register(pool.shutdown, wait=False)
+        return pool
+
+    return shared(("render_pool",), build)
@@ -0,0 +1,74 @@
+# resources.py
+
+import threading
+import time
+import os
+
+
+CHAT_MODEL = "gemini-2.5-flash"
+SUMMARY_MODEL = "gemini-2.5-pro"
+
+# key -> client shared by every session of the server. Clients are built on
+# first use, so importing a module never pays for the Gemini SDK, and reusing
+# one client keeps its HTTP/gRPC connections open across requests.
+_resources = {}
+_resources_lock = threading.RLock()
+_stats = {"built": 0, "reused": 0, "build_seconds": 0.0}
+_env_loaded = False
+
+
+def _load_env():
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def shared(key, factory):
+    with _resources_lock:
+        resource = _resources.get(key)
+        if resource is not None:
+            _stats["reused"] += 1
+            return resource
+        _load_env()
+        start = time.perf_counter()
+        resource = factory()
+        _stats["build_seconds"] += time.perf_counter() - start
+        _stats["built"] += 1
+        _resources[key] = resource
+        return resource
+
+
+def get_chat_model(model: str = CHAT_MODEL, temperature: float = 0.2):
+    def build():
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from metrics_utils import llm_tracer
+        return ChatGoogleGenerativeAI(
+            model=model, temperature=temperature, google_api_key=os.getenv("GOOGLE_API_KEY"), callbacks=[llm_tracer],
+        )
+
+    return shared(("chat", model, temperature), build)
+
+
+def get_summary_model():
+    return get_chat_model(SUMMARY_MODEL, temperature=0.5)
+
+
+def get_summarizer():
+    # Long inputs are condensed section by section with the fast model
+    def build():
+        from summary_utils import HierarchicalSummarizer
+        return HierarchicalSummarizer(get_chat_model())
+
+    return shared(("summarizer", CHAT_MODEL), build)
+
+
+def resource_stats():
+    with _resources_lock:
+        return dict(_stats, resources=len(_resources))
+
+
+def clear_resources():
+    with _resources_lock:
+        _resources.clear()
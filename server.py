@@ -0,0 +1,276 @@
+# server.py
+
+from aiohttp import web
+from engine import RAGEngine, parse_source
+from cache_utils import text_hash
+from index_store import vectorstore_key
+from metrics_utils import prometheus_text, recent_spans, otlp_payload, span
+from collections import OrderedDict
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+
+
+MAX_INFLIGHT = 16       # upstream calls running at once
+MAX_QUEUE = 64          # requests allowed to wait for a slot before 503
+MAX_BATCH_QUESTIONS = 256
+MAX_INDEXES = 64        # ingested indexes kept; the least recently used are dropped
+
+
+class Coalescer:
+    # Identical requests that arrive while one is already running share its
+    # result instead of making their own upstream call
+
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled waiter must not cancel the call other waiters share
+        return await asyncio.shield(task)
+
+
+class Backpressure:
+    # At most `max_inflight` calls run; up to `max_queue` more wait, and any
+    # beyond that are rejected straight away with 503 + Retry-After
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE):
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_inflight)
+        self.waiting = 0
+        self.rejected = 0
+
+    def admit(self):
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(text="Server busy, retry later", headers={"Retry-After": "1"})
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        # One slot for work already admitted (a batch item), no queue check
+        await self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def __aenter__(self):
+        self.admit()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def __aexit__(self, *exc):
+        self._slots.release()
+
+
+class RAGService:
+    # Async API over the engine's chains:
+    #   POST /ingest     {"sources": ["url:...", "pdf:...", ...]} -> {"index_id", ...}
+    #   POST /ask        {"question", "index_id"?, "memory"?, "query"?} -> {"answer"}
+    #   POST /ask_batch  {"questions": [...], "index_id"?} -> {"answers": [...]}
+    #   POST /summarize  {"index_id"} or {"text"} -> {"summary"}
+    #   GET  /stats
+    #   GET  /metrics    Prometheus text format
+    #   GET  /traces     recent spans as JSON lines (?format=otlp for OTLP/JSON)
+    # Without "index_id" questions go to the plain chat chain.
+
+    def __init__(self, llm=None, embeddings=None, summary_llm=None, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE, max_indexes: int = MAX_INDEXES):
+        self.llm = llm
+        self.embeddings = embeddings
+        self.summary_llm = summary_llm
+        self.max_indexes = max_indexes
+        self.engines = OrderedDict()    # index_id -> (RAGEngine, qa chain), least recently used first
+        self.chat = None
+        self.coalescer = Coalescer()
+        self.backpressure = Backpressure(max_inflight, max_queue)
+        self.requests = 0
+        self.started_at = time.time()
+
+    def _engine(self):
+        return RAGEngine(llm=self.llm, embeddings=self.embeddings, summary_llm=self.summary_llm)
+
+    def _chain(self, index_id):
+        if index_id is None:
+            if self.chat is None:
+                self.chat = self._engine().qa_chain()
+            return self.chat
+        return self._indexed(index_id)[1]
+
+    def _indexed(self, index_id):
+        if index_id not in self.engines:
+            raise web.HTTPNotFound(text=f"Unknown index_id {index_id!r}, ingest it first")
+        self.engines.move_to_end(index_id)
+        return self.engines[index_id]
+
+    def _remember(self, index_id, engine):
+        self.engines[index_id] = (engine, engine.qa_chain())
+        self.engines.move_to_end(index_id)
+        while len(self.engines) > self.max_indexes:
+            self.engines.popitem(last=False)
+
+    @staticmethod
+    async def _json(request):
+        try:
+            return await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="Request body must be JSON")
+
+    async def ingest(self, request):
+        body = await self._json(request)
+        sources = body.get("sources") or []
+        try:
+            specs = sorted(f"{kind}:{value}" for kind, value in map(parse_source, sources))
+        except (ValueError, KeyError, TypeError) as e:
+            raise web.HTTPBadRequest(text=str(e))
+
+        async def build():
+            async with self.backpressure:
+                engine = self._engine()
+                with span("server.ingest", sources=len(specs)):
+                    stats = await asyncio.to_thread(engine.ingest, specs)
+            index_id = vectorstore_key(engine.vectorstore) or hashlib.sha256("\n".join(specs).encode("utf-8")).hexdigest()
+            self._remember(index_id, engine)
+            return {"index_id": index_id, **stats}
+
+        self.requests += 1
+        try:
+            result = await self.coalescer.run(("ingest", tuple(specs)), build)
+        except ValueError as e:
+            raise web.HTTPUnprocessableEntity(text=str(e))
+        return web.json_response(result)
+
+    async def ask(self, request):
+        body = await self._json(request)
+        question = body.get("question")
+        if not question:
+            raise web.HTTPBadRequest(text="'question' is required")
+        index_id = body.get("index_id")
+        memory = body.get("memory") or ""
+        chain = self._chain(index_id)
+        inputs = {"question": question, "query": body.get("query") or question, "memory": memory}
+
+        async def call():
+            async with self.backpressure:
+                with span("server.ask", memory=bool(memory)):
+                    return await chain.ainvoke(inputs)
+
+        self.requests += 1
+        key = ("ask", index_id, question, inputs["query"], text_hash(memory))
+        return web.json_response({"answer": await self.coalescer.run(key, call)})
+
+    async def ask_batch(self, request):
+        body = await self._json(request)
+        questions = body.get("questions") or []
+        if not questions or len(questions) > MAX_BATCH_QUESTIONS:
+            raise web.HTTPBadRequest(text=f"'questions' must hold 1 to {MAX_BATCH_QUESTIONS} questions")
+        chain = self._chain(body.get("index_id"))
+        unique = list(dict.fromkeys(questions))
+
+        async def one(question):
+            async with self.backpressure.slot():
+                return await chain.ainvoke({"question": question, "query": question, "memory": ""})
+
+        async def call():
+            # The batch is admitted once, then each question takes its own
+            # slot, so a batch never runs more calls than max_inflight allows
+            self.backpressure.admit()
+            with span("server.ask_batch", questions=len(unique)):
+                return await asyncio.gather(*map(one, unique), return_exceptions=True)
+
+        self.requests += 1
+        outputs = dict(zip(unique, await self.coalescer.run(("ask_batch", body.get("index_id"), tuple(unique)), call)))
+        return web.json_response({"answers": [
+            {"question": q, "answer": None, "error": str(outputs[q])} if isinstance(outputs[q], Exception)
+            else {"question": q, "answer": outputs[q], "error": None}
+            for q in questions
+        ]})
+
+    async def summarize(self, request):
+        body = await self._json(request)
+        index_id = body.get("index_id")
+        if index_id is not None:
+            engine = self._indexed(index_id)[0]
+            text = engine.documents_text()
+        else:
+            engine, text = None, body.get("text") or ""
+        if not text.strip():
+            raise web.HTTPBadRequest(text="Nothing to summarize: pass 'index_id' or 'text'")
+
+        async def call():
+            async with self.backpressure:
+                with span("server.summarize", chars=len(text)):
+                    return await (engine or self._engine()).summary_chain().ainvoke({"context": text})
+
+        self.requests += 1
+        return web.json_response({"summary": await self.coalescer.run(("summarize", text_hash(text)), call)})
+
+    async def stats(self, request):
+        return web.json_response({
+            "requests": self.requests,
+            "upstream_calls": self.coalescer.started,
+            "coalesced": self.coalescer.coalesced,
+            "rejected": self.backpressure.rejected,
+            "waiting": self.backpressure.waiting,
+            "indexes": len(self.engines),
+            "uptime_seconds": time.time() - self.started_at,
+        })
+
+    async def metrics(self, request):
+        return web.Response(text=prometheus_text(), content_type="text/plain")
+
+    async def traces(self, request):
+        spans = recent_spans(request.query.get("trace_id"))
+        if request.query.get("format") == "otlp":
+            return web.json_response(otlp_payload(spans))
+        return web.Response(text="".join(json.dumps(s, default=str) + "\n" for s in spans), content_type="application/x-ndjson")
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.add_routes([
+            web.post("/ingest", self.ingest),
+            web.post("/ask", self.ask),
+            web.post("/ask_batch", self.ask_batch),
+            web.post("/summarize", self.summarize),
+            web.get("/stats", self.stats),
+            web.get("/metrics", self.metrics),
+            web.get("/traces", self.traces),
+        ])
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve MiRAG over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-inflight", type=int, default=MAX_INFLIGHT)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--max-indexes", type=int, default=MAX_INDEXES)
+    parser.add_argument("--fake", action="store_true", help="Use the offline fake LLM and embeddings")
+    args = parser.parse_args()
+
+    llm = embeddings = None
+    if args.fake:
+        from fake_backends import EchoChatModel, HashEmbeddings
+        llm, embeddings = EchoChatModel(), HashEmbeddings()
+
+    service = RAGService(llm=llm, embeddings=embeddings, max_inflight=args.max_inflight, max_queue=args.max_queue, max_indexes=args.max_indexes)
+    web.run_app(service.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
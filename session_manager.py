@@ -0,0 +1,401 @@
+# session_manager.py
+
+from langchain_core.documents import Document
+from collections import OrderedDict
+from cache_utils import text_hash
+from index_store import vectorstore_key, is_stored, load_index, unload_index
+import threading
+import time
+import zlib
+import os
+
+
+MEMORY_BUDGET_MB = float(os.getenv("MIRAG_MEMORY_BUDGET_MB", "1024"))
+SESSION_IDLE_SECONDS = float(os.getenv("MIRAG_SESSION_IDLE_SECONDS", "1800"))
+# Indexes used more recently than this stay loaded even over budget, so a
+# question touching several indexes does not evict and reload them in turn
+EVICT_MIN_IDLE_SECONDS = float(os.getenv("MIRAG_EVICT_MIN_IDLE_SECONDS", "60"))
+
+
+def vectorstore_nbytes(vectorstore) -> int:
+    # Estimate: raw vectors plus chunk text. Mapped indexes count too, since
+    # their pages stay resident while in use.
+    index = vectorstore.index
+    size = index.ntotal * index.d * 4
+    docs = getattr(vectorstore.docstore, "_dict", {})
+    return size + sum(len(doc.page_content) for doc in docs.values() if isinstance(doc, Document))
+
+
+class TextStore:
+    # Raw document text kept once per process, zlib-compressed and shared by
+    # every session that loaded the same content (refcounted by hash)
+
+    def __init__(self):
+        self._texts = {}        # hash -> [compressed bytes, refs, raw length]
+        self._bytes = 0         # compressed size of all entries
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        h = text_hash(text)
+        with self._lock:
+            entry = self._texts.get(h)
+            if entry is None:
+                data = zlib.compress(text.encode("utf-8"), 6)
+                self._texts[h] = [data, 1, len(text)]
+                self._bytes += len(data)
+            else:
+                entry[1] += 1
+        return h
+
+    def get(self, h: str) -> str:
+        with self._lock:
+            data = self._texts[h][0]
+        return zlib.decompress(data).decode("utf-8")
+
+    def release(self, h: str):
+        with self._lock:
+            entry = self._texts.get(h)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    self._bytes -= len(self._texts.pop(h)[0])
+
+    def nbytes(self, hashes=None) -> int:
+        with self._lock:
+            if hashes is None:
+                return self._bytes
+            return sum(len(self._texts[h][0]) for h in hashes if h in self._texts)
+
+    def stats(self):
+        with self._lock:
+            raw = sum(e[2] for e in self._texts.values())
+            stored = sum(len(e[0]) for e in self._texts.values())
+            return {"entries": len(self._texts), "raw_bytes": raw, "stored_bytes": stored,
+                    "ratio": stored / raw if raw else 0.0}
+
+
+class CompactDocuments:
+    # Documents whose text lives in a TextStore; rebuilt on demand
+
+    def __init__(self, docs, store: TextStore):
+        self.store = store
+        self.items = [(store.put(doc.page_content), dict(doc.metadata)) for doc in docs]
+
+    def __len__(self):
+        return len(self.items)
+
+    def documents(self):
+        return [Document(page_content=self.store.get(h), metadata=dict(m)) for h, m in self.items]
+
+    def text(self, separator: str = "\n\n") -> str:
+        return separator.join(self.store.get(h) for h, _ in self.items)
+
+    def nbytes(self) -> int:
+        return self.store.nbytes({h for h, _ in self.items})
+
+    def release(self):
+        for h, _ in self.items:
+            self.store.release(h)
+        self.items = []
+
+
+class _IndexEntry:
+    def __init__(self, key: str, vectorstore):
+        self.key = key
+        self.vectorstore = vectorstore
+        self.embeddings = vectorstore.embeddings
+        self.nbytes = vectorstore_nbytes(vectorstore)
+        self.refs = set()           # session ids
+        self.chains = {}            # builder name -> chain over this index
+        self.last_used = time.time()
+
+
+class SessionResources:
+    # What one browser session holds: an index + chain builder per slot
+    # ("web", "pdf", ...), loaded documents in compact form and its
+    # all-sources collection. Indexes are looked up through the manager, so
+    # they can be shared with other sessions or evicted and reloaded; the
+    # collection only points at them and is created with the first source.
+    # `slots` and `docs` change under the manager's lock, which usage() and
+    # total_bytes() hold while reading every session.
+
+    def __init__(self, session_id: str, manager):
+        self.session_id = session_id
+        self.manager = manager
+        self.slots = {}             # slot -> (index key, build(vectorstore) -> chain)
+        self.docs = {}              # slot -> CompactDocuments
+        self._collection = None
+        self.created = self.last_seen = time.time()
+
+    def use_index(self, slot: str, vectorstore, build, key: str = None):
+        key = self.manager.register(vectorstore, key)
+        with self.manager._lock:
+            self.manager.acquire(self.session_id, key)
+            previous = self.slots.get(slot)
+            self.slots[slot] = (key, build)
+            if previous is not None:
+                self._release_key(previous[0])
+        self.manager.enforce_budget()
+        return key
+
+    def _release_key(self, key: str):
+        held = self._collection.store_keys() if self._collection is not None else ()
+        if key not in (k for k, _ in self.slots.values()) and key not in held:
+            self.manager.release(self.session_id, key)
+
+    def has(self, slot: str) -> bool:
+        return slot in self.slots
+
+    def vectorstore(self, slot: str):
+        return self.manager.vectorstore(self.slots[slot][0])
+
+    def chain(self, slot: str):
+        key, build = self.slots[slot]
+        return self.manager.chain(key, slot, build)
+
+    def set_documents(self, slot: str, docs):
+        compact = CompactDocuments(docs, self.manager.texts)
+        with self.manager._lock:
+            old = self.docs.pop(slot, None)
+            self.docs[slot] = compact
+        if old is not None:
+            old.release()
+        self.manager.enforce_budget()
+
+    def documents(self, slot: str):
+        return self.docs[slot].documents() if slot in self.docs else []
+
+    def text(self, slot: str) -> str:
+        return self.docs[slot].text() if slot in self.docs else ""
+
+    def release(self, slot: str):
+        with self.manager._lock:
+            entry = self.slots.pop(slot, None)
+            if entry is not None:
+                self._release_key(entry[0])
+            docs = self.docs.pop(slot, None)
+        if docs is not None:
+            docs.release()
+
+    @property
+    def collection(self):
+        # None until a source is added
+        return self._collection
+
+    def add_source(self, vectorstore, source_type: str, default_source: str = "", key: str = None):
+        key = self.manager.register(vectorstore, key)
+        self.manager.acquire(self.session_id, key)
+        if self._collection is None:
+            from collection import Collection
+            self._collection = Collection(vectorstore.embeddings, resolve=self.manager.vectorstore)
+        before = self._collection.store_keys()
+        added = self._collection.add_vectorstore(vectorstore, source_type, default_source, key)
+        with self.manager._lock:
+            for old in before - self._collection.store_keys():
+                self._release_key(old)
+        self.manager.enforce_budget()
+        return added
+
+    def remove_source(self, source_id: str) -> bool:
+        if self._collection is None:
+            return False
+        before = self._collection.store_keys()
+        removed = self._collection.remove_source(source_id)
+        with self.manager._lock:
+            for old in before - self._collection.store_keys():
+                self._release_key(old)
+        return removed
+
+    def list_sources(self):
+        return self._collection.list_sources() if self._collection is not None else []
+
+    def collection_nbytes(self) -> int:
+        return self._collection.nbytes() if self._collection is not None else 0
+
+    def close(self):
+        for slot in list(self.slots) + list(self.docs):
+            self.release(slot)
+        if self._collection is not None:
+            keys = self._collection.store_keys()
+            self._collection = None
+            for key in keys:
+                self._release_key(key)
+
+
+class ResourceManager:
+    # Server-wide owner of what sessions load. Identical indexes (same
+    # index_store key) are held once and refcounted by session; when the
+    # estimated total exceeds the budget, the least recently used indexes
+    # that index_store can map back from disk are dropped from memory.
+    # Sessions idle for `idle_seconds` are closed and their share freed.
+    # The loaders' own registries (PDF jobs, videos, live URLs) keep only
+    # keys or unloadable stores, so an eviction here does free the index.
+
+    def __init__(self, budget_mb: float = MEMORY_BUDGET_MB, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 min_idle_seconds: float = EVICT_MIN_IDLE_SECONDS):
+        self.budget_bytes = int(budget_mb * 1e6)
+        self.idle_seconds = idle_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.texts = TextStore()
+        self._indexes = OrderedDict()       # key -> _IndexEntry, least recently used first
+        self._index_bytes = 0               # estimated size of the loaded indexes
+        self._sessions = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+        self.expired_sessions = 0
+
+    def session(self, session_id: str) -> SessionResources:
+        with self._lock:
+            self.expire_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = SessionResources(session_id, self)
+            session.last_seen = time.time()
+            return session
+
+    def close_session(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                session.close()
+
+    def expire_idle(self):
+        now = time.time()
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if now - session.last_seen > self.idle_seconds:
+                    self.close_session(session_id)
+                    self.expired_sessions += 1
+
+    def register(self, vectorstore, key: str = None) -> str:
+        # Stores edited in place (live web indexes) carry a storage key that
+        # stays the same across their content changes
+        key = key or getattr(vectorstore, "storage_key", None) or vectorstore_key(vectorstore) or f"session:{id(vectorstore)}"
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is None:
+                entry = self._indexes[key] = _IndexEntry(key, vectorstore)
+            else:
+                if entry.vectorstore is not None:
+                    self._index_bytes -= entry.nbytes
+                # A reloaded or refreshed copy replaces the one held here
+                if entry.vectorstore is not vectorstore:
+                    entry.vectorstore = vectorstore
+                    entry.chains.clear()
+                entry.nbytes = vectorstore_nbytes(vectorstore)
+            self._index_bytes += entry.nbytes
+            self._touch(key)
+        return key
+
+    def _touch(self, key: str):
+        entry = self._indexes[key]
+        entry.last_used = time.time()
+        self._indexes.move_to_end(key)
+        return entry
+
+    def acquire(self, session_id: str, key: str):
+        with self._lock:
+            self._indexes[key].refs.add(session_id)
+
+    def release(self, session_id: str, key: str):
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is None:
+                return
+            entry.refs.discard(session_id)
+            # Unshared and not reloadable: nothing would ever use it again
+            if not entry.refs and not is_stored(key):
+                if entry.vectorstore is not None:
+                    self._index_bytes -= entry.nbytes
+                del self._indexes[key]
+
+    def vectorstore(self, key: str):
+        # Called for every index a question searches, so it only looks at
+        # the budget when it had to load something
+        with self._lock:
+            entry = self._touch(key)
+            if entry.vectorstore is not None:
+                return entry.vectorstore
+            entry.vectorstore = load_index(key, entry.embeddings)
+            self.reloads += 1
+            if entry.vectorstore is None:
+                raise LookupError(f"Index {key} was evicted and is no longer on disk")
+            self._index_bytes += entry.nbytes
+            vectorstore = entry.vectorstore
+        self.enforce_budget(keep=key)
+        return vectorstore
+
+    def chain(self, key: str, name: str, build):
+        # Chains hold no per-user state (memory is passed in), so sessions
+        # asking the same index for the same kind of chain share one
+        vectorstore = self.vectorstore(key)
+        with self._lock:
+            entry = self._indexes[key]
+            if name not in entry.chains:
+                entry.chains[name] = build(vectorstore)
+            return entry.chains[name]
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            collections = sum(s.collection_nbytes() for s in self._sessions.values())
+            return self._index_bytes + collections + self.texts.nbytes()
+
+    def enforce_budget(self, keep: str = None):
+        # Evict least recently used indexes until the estimate fits the budget
+        with self._lock:
+            total = self.total_bytes()
+            now = time.time()
+            for key, entry in list(self._indexes.items()):
+                if total <= self.budget_bytes or now - entry.last_used < self.min_idle_seconds:
+                    break
+                if key == keep or entry.vectorstore is None:
+                    continue
+                if entry.refs and not is_stored(key):
+                    continue
+                total -= entry.nbytes
+                self._index_bytes -= entry.nbytes
+                if entry.refs:
+                    entry.vectorstore = None
+                    entry.chains.clear()
+                else:
+                    del self._indexes[key]
+                unload_index(key)
+                self.evictions += 1
+
+    def usage(self):
+        # Estimated bytes per index and per session; a shared index is split
+        # evenly between the sessions using it
+        with self._lock:
+            indexes = [{
+                "key": e.key, "bytes": e.nbytes, "loaded": e.vectorstore is not None,
+                "sessions": len(e.refs), "idle_seconds": time.time() - e.last_used,
+            } for e in reversed(self._indexes.values())]
+            sessions = []
+            for s in self._sessions.values():
+                keys = {key for key, _ in s.slots.values()}
+                index_bytes = sum(
+                    self._indexes[k].nbytes / max(len(self._indexes[k].refs), 1)
+                    for k in keys if k in self._indexes and self._indexes[k].vectorstore is not None
+                )
+                sessions.append({
+                    "session_id": s.session_id, "indexes": len(keys), "index_bytes": int(index_bytes),
+                    "text_bytes": sum(d.nbytes() for d in s.docs.values()),
+                    "collection_bytes": s.collection_nbytes(),
+                    "idle_seconds": time.time() - s.last_seen,
+                })
+            return {
+                "budget_bytes": self.budget_bytes,
+                "total_bytes": self.total_bytes(),
+                "sessions": sessions,
+                "indexes": indexes,
+                "texts": self.texts.stats(),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "expired_sessions": self.expired_sessions,
+            }
+
+
+def get_resource_manager():
+    from resources import shared
+    return shared(("resource_manager",), ResourceManager)
@@ -0,0 +1,199 @@
+# summary_utils.py
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import get_summary_cache, text_hash
+import argparse
+import hashlib
+
+
+map_prompt = PromptTemplate(
+        template="""
+        You are summarizing one section of a longer document. Write a dense, detailed summary of this section that keeps all key facts, names, numbers, arguments and conclusions. Do not add information that is not in the section.
+
+        Section:
+        {context}
+
+        Section Summary:""",
+            input_variables=["context"]
+        )
+
+reduce_prompt = PromptTemplate(
+        template="""
+        The following are summaries of consecutive sections of one document. Merge them into a single coherent, detailed summary that keeps every important fact and preserves the original order of ideas.
+
+        Section Summaries:
+        {context}
+
+        Merged Summary:""",
+            input_variables=["context"]
+        )
+
+
+def model_id(llm) -> str:
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+
+
+class HierarchicalSummarizer:
+    # Map-reduce summarizer for long inputs. The text is cut into
+    # content-defined groups, each group is summarized in a bounded worker
+    # pool, and the partial summaries are merged in a tree until they fit
+    # into `max_context_chars`. Every intermediate summary is cached by the
+    # hash of its input, so only changed groups are recomputed.
+
+    def __init__(
+        self,
+        llm,
+        max_context_chars: int = 48000,
+        min_group_chars: int = 6000,
+        max_group_chars: int = 16000,
+        fan_in: int = 4,
+        max_workers: int = 4,
+        cache=None,
+    ):
+        self.llm = llm
+        self.max_context_chars = max_context_chars
+        self.min_group_chars = min_group_chars
+        self.max_group_chars = max_group_chars
+        self.fan_in = fan_in
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else get_summary_cache()
+
+        parser = StrOutputParser()
+        self.map_chain = map_prompt | llm | parser
+        self.reduce_chain = reduce_prompt | llm | parser
+        self.model_id = model_id(llm)
+        self._splitter = RecursiveCharacterTextSplitter(chunk_size=max_group_chars // 4, chunk_overlap=0)
+
+    def group_text(self, text: str):
+        # Content-defined boundaries: a group closes after a paragraph whose
+        # hash hits the boundary condition, so an edit only shifts the
+        # groups around it instead of every group after it.
+        paragraphs = []
+        for para in text.split("\n\n"):
+            para = para.strip()
+            if not para:
+                continue
+            if len(para) > self.max_group_chars // 4:
+                paragraphs.extend(self._splitter.split_text(para))
+            else:
+                paragraphs.append(para)
+
+        groups, current, size = [], [], 0
+        for para in paragraphs:
+            current.append(para)
+            size += len(para)
+            at_boundary = int(text_hash(para)[:8], 16) % 4 == 0
+            if size >= self.max_group_chars or (size >= self.min_group_chars and at_boundary):
+                groups.append("\n\n".join(current))
+                current, size = [], 0
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    def _cache_key(self, stage: str, text: str) -> str:
+        return hashlib.sha256(f"{stage}\x00{self.model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _summarize_one(self, stage: str, chain, text: str) -> str:
+        key = self._cache_key(stage, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        summary = chain.invoke({"context": text})
+        self.cache.put(key, summary)
+        return summary
+
+    def _summarize_all(self, stage: str, chain, texts):
+        if len(texts) == 1:
+            return [self._summarize_one(stage, chain, texts[0])]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda t: self._summarize_one(stage, chain, t), texts))
+
+    def condense(self, text: str) -> str:
+        # Returns text that fits into one final prompt
+        if len(text) <= self.max_context_chars:
+            return text
+
+        partials = self._summarize_all("map", self.map_chain, self.group_text(text))
+
+        while len(partials) > 1 and sum(len(p) for p in partials) > self.max_context_chars:
+            partials = self._summarize_all("reduce", self.reduce_chain, self._merge_groups(partials))
+
+        return "\n\n".join(partials)
+
+    def _merge_groups(self, partials):
+        # Same content-defined idea one level up, averaging `fan_in` partials per group
+        groups, current = [], []
+        for partial in partials:
+            current.append(partial)
+            at_boundary = int(text_hash(partial)[:8], 16) % self.fan_in == 0
+            if len(current) >= 2 * self.fan_in or (len(current) >= 2 and at_boundary):
+                groups.append("\n\n".join(current))
+                current = []
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    def summarize(self, text: str) -> str:
+        condensed = self.condense(text)
+        return self._summarize_one("reduce", self.reduce_chain, condensed)
+
+
+class CachedSummaryChain(Runnable):
+    # {"context": text} -> summary. The text is condensed by `summarizer`,
+    # then the final pass runs `prompt | llm`. That final summary is cached
+    # on the condensed text, the prompt and the model, so summarizing the
+    # same content again makes no model call at all.
+
+    def __init__(self, prompt, llm, summarizer: HierarchicalSummarizer, cache=None):
+        self.summarizer = summarizer
+        self.chain = prompt | llm | StrOutputParser()
+        self.cache = cache if cache is not None else get_summary_cache()
+        self._stage = f"final\x00{prompt.template}"
+        self._model_id = model_id(llm)
+
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self._stage}\x00{self._model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def invoke(self, input, config=None, **kwargs):
+        return "".join(self.stream(input, config, **kwargs))
+
+    def stream(self, input, config=None, **kwargs):
+        context = self.summarizer.condense(input["context"])
+        key = self._cache_key(context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        for chunk in self.chain.stream({"context": context}, config, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(key, "".join(parts))
+
+
+def main():
+    from fake_backends import EchoChatModel
+
+    parser = argparse.ArgumentParser(description="Run the hierarchical summarizer offline with a stub LLM.")
+    parser.add_argument("path", help="Text file to summarize")
+    parser.add_argument("--max-context-chars", type=int, default=48000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        text = f.read()
+
+    llm = EchoChatModel()
+    summarizer = HierarchicalSummarizer(llm, max_context_chars=args.max_context_chars, max_workers=args.workers)
+    summary = summarizer.summarize(text)
+    print(summary)
+    print(f"\n[{llm.calls} LLM calls, cache {summarizer.cache.stats()}]")
+
+
+if __name__ == "__main__":
+    main()
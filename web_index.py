@@ -0,0 +1,263 @@
+# web_index.py
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from cache_utils import text_hash
+from index_store import LIVE_INDEX_DIR, embedding_model_name, set_vectorstore_key, touch_index
+from lexical_index import BM25Index, attach_lexical_index, get_lexical_index
+from chunking import get_splitter
+from crawl_utils import html_to_text, render_with_selenium, USER_AGENT, FETCH_TIMEOUT_SECONDS
+from collections import OrderedDict
+import threading
+import requests
+import hashlib
+import pickle
+import faiss
+import json
+import time
+import os
+
+
+LIVE_INDEX_MAX_LOADED = 32
+
+# (url, embedding model) -> LiveUrlIndex, shared by every session of the server;
+# the least recently used ones are dropped and reloaded from disk when needed.
+# Their stores may also be unloaded on their own (see unload_live_index).
+_live = OrderedDict()
+_live_lock = threading.Lock()
+
+
+class _LiveFAISS(FAISS):
+    # FAISS store that may be searched from any session while a refresh
+    # deletes and adds chunks in place
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def add_embeddings(self, *args, **kwargs):
+        with self._lock:
+            return super().add_embeddings(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self._lock:
+            return super().delete(*args, **kwargs)
+
+    def similarity_search_with_score_by_vector(self, *args, **kwargs):
+        with self._lock:
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+
+class LiveUrlIndex:
+    # A mutable per-URL index that is kept in sync with the page by diffing
+    # chunk hashes: only new chunks are embedded and vanished ones deleted.
+    # ETag / Last-Modified let an unchanged page skip the download entirely.
+    # The page text is kept on disk only, and the store can be unloaded and
+    # read back, so the resource manager can evict it like any stored index.
+
+    def __init__(self, url: str, embeddings, splitter=None):
+        self.url = url
+        self.embeddings = embeddings
+        self.splitter = splitter or get_splitter("web")
+        self.model = embedding_model_name(embeddings)
+        self.name = hashlib.sha256(f"{self.model}\x00{url}".encode("utf-8")).hexdigest()
+        self.path = os.path.join(LIVE_INDEX_DIR, self.name)
+
+        self.key = f"live/{self.name}"
+
+        self.vectorstore = None
+        self.chunk_ids = []
+        self.etag = None
+        self.last_modified = None
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        index_path = os.path.join(self.path, "index.faiss")
+        state_path = os.path.join(self.path, "state.pkl")
+        if not (os.path.exists(index_path) and os.path.exists(state_path)):
+            return
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+        # Read fully into memory: this index is edited in place
+        self.vectorstore = _LiveFAISS(
+            embedding_function=self.embeddings,
+            index=faiss.read_index(index_path),
+            docstore=state["docstore"],
+            index_to_docstore_id=state["index_to_docstore_id"],
+        )
+        self.vectorstore.storage_key = self.key
+        self.chunk_ids = state["chunk_ids"]
+        self.etag = state["etag"]
+        self.last_modified = state["last_modified"]
+        lexical_path = os.path.join(self.path, "lexical.pkl")
+        if os.path.exists(lexical_path):
+            attach_lexical_index(self.vectorstore, BM25Index.load(lexical_path))
+        set_vectorstore_key(self.vectorstore, self.identity())
+        touch_index(self.path)
+
+    def load(self):
+        # The store, read back from disk if it was unloaded
+        vectorstore = self.vectorstore
+        if vectorstore is None:
+            with self.lock:
+                if self.vectorstore is None:
+                    self._load()
+                vectorstore = self.vectorstore
+        return vectorstore
+
+    def unload(self):
+        with self.lock:
+            loaded = self.vectorstore is not None
+            self.vectorstore = None
+            return loaded
+
+    def documents(self):
+        # Page documents of the last fetch
+        try:
+            with open(os.path.join(self.path, "docs.pkl"), "rb") as f:
+                return pickle.load(f)
+        except OSError:
+            return []
+
+    def _save(self, docs):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_index = os.path.join(self.path, "index.faiss.tmp")
+        tmp_state = os.path.join(self.path, "state.pkl.tmp")
+        tmp_docs = os.path.join(self.path, "docs.pkl.tmp")
+        faiss.write_index(self.vectorstore.index, tmp_index)
+        with open(tmp_state, "wb") as f:
+            pickle.dump({
+                "docstore": self.vectorstore.docstore,
+                "index_to_docstore_id": self.vectorstore.index_to_docstore_id,
+                "chunk_ids": self.chunk_ids,
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+            }, f)
+        with open(tmp_docs, "wb") as f:
+            pickle.dump(docs, f)
+        get_lexical_index(self.vectorstore).save(os.path.join(self.path, "lexical.pkl"))
+        os.replace(tmp_index, os.path.join(self.path, "index.faiss"))
+        os.replace(tmp_state, os.path.join(self.path, "state.pkl"))
+        os.replace(tmp_docs, os.path.join(self.path, "docs.pkl"))
+        self._save_meta()
+
+    def _save_meta(self):
+        # Same meta.json as index_store's indexes, so `index_store list|evict` covers these too
+        meta_path = os.path.join(self.path, "meta.json")
+        now = time.time()
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                created = json.load(f)["created"]
+        except (OSError, ValueError, KeyError):
+            created = now
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "key": self.key, "source": self.url, "chunks": len(self.chunk_ids),
+                "index_type": type(self.vectorstore.index).__name__, "created": created, "last_used": now,
+            }, f)
+
+    def identity(self) -> str:
+        digest = hashlib.sha256(self.path.encode("utf-8"))
+        for chunk_id in sorted(self.chunk_ids):
+            digest.update(chunk_id.encode("ascii"))
+        return f"live:{digest.hexdigest()}"
+
+    def _fetch(self, use_selenium: bool):
+        # -> (page docs, (etag, last_modified)), or None when the server says
+        # nothing changed. The caller keeps the validators only once the new
+        # content is indexed, so a failed refresh fetches it again.
+        validators = (None, None)
+        if use_selenium:
+            text, title = render_with_selenium(self.url)
+        else:
+            headers = {"User-Agent": USER_AGENT}
+            if self.vectorstore is not None:
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.last_modified:
+                    headers["If-Modified-Since"] = self.last_modified
+            response = requests.get(self.url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS)
+            if response.status_code == 304 and self.vectorstore is not None:
+                return None
+            response.raise_for_status()
+            validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            title, text = html_to_text(response.text)
+        return [Document(page_content=text, metadata={"source": self.url, "title": title})], validators
+
+    def refresh(self, use_selenium: bool = False):
+        with self.lock:
+            if self.vectorstore is None:
+                self._load()
+            fetched = self._fetch(use_selenium)
+            if fetched is None:
+                return {"fetched": False, "added": 0, "removed": 0, "kept": len(self.chunk_ids)}
+            docs, validators = fetched
+
+            chunks, metadatas = {}, {}
+            for chunk in self.splitter.split_documents(docs):
+                h = text_hash(chunk.page_content)
+                if h not in chunks:
+                    chunks[h], metadatas[h] = chunk.page_content, chunk.metadata
+            if not chunks:
+                raise ValueError(f"No text content found at {self.url}")
+
+            new_ids = list(chunks)
+            new_set, old_set = set(new_ids), set(self.chunk_ids)
+            added = [i for i in new_ids if i not in old_set]
+            removed = [i for i in self.chunk_ids if i not in new_set]
+
+            if self.vectorstore is None:
+                self.vectorstore = _LiveFAISS.from_texts(
+                    [chunks[i] for i in new_ids], self.embeddings,
+                    metadatas=[metadatas[i] for i in new_ids], ids=new_ids,
+                )
+                self.vectorstore.storage_key = self.key
+                attach_lexical_index(self.vectorstore, BM25Index()).add_many(new_ids, [chunks[i] for i in new_ids])
+            else:
+                # Embed before taking the search lock; searches wait only for the index update
+                texts = [chunks[i] for i in added]
+                vectors = self.embeddings.embed_documents(texts) if added else []
+                lexical = get_lexical_index(self.vectorstore)
+                with self.vectorstore._lock:
+                    if removed:
+                        self.vectorstore.delete(removed)
+                        lexical.remove(removed)
+                    if added:
+                        self.vectorstore.add_embeddings(
+                            list(zip(texts, vectors)), metadatas=[metadatas[i] for i in added], ids=added,
+                        )
+                        lexical.add_many(added, texts)
+
+            self.chunk_ids = new_ids
+            self.etag, self.last_modified = validators
+            self._save(docs)
+            set_vectorstore_key(self.vectorstore, self.identity())
+            return {"fetched": True, "added": len(added), "removed": len(removed), "kept": len(new_ids) - len(added)}
+
+
+def get_live_index(url: str, embeddings):
+    key = (url, embedding_model_name(embeddings))
+    with _live_lock:
+        if key not in _live:
+            _live[key] = LiveUrlIndex(url, embeddings)
+            while len(_live) > LIVE_INDEX_MAX_LOADED:
+                _live.popitem(last=False)
+        _live.move_to_end(key)
+        return _live[key]
+
+
+def load_live_index(name: str, embeddings):
+    # index_store.load_index("live/<name>"): the URL comes from the index's meta.json
+    try:
+        with open(os.path.join(LIVE_INDEX_DIR, name, "meta.json"), encoding="utf-8") as f:
+            url = json.load(f)["source"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return get_live_index(url, embeddings).load()
+
+
+def unload_live_index(name: str) -> bool:
+    with _live_lock:
+        live = [index for index in _live.values() if index.name == name]
+    return any([index.unload() for index in live])
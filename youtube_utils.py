@@ -1,33 +1,145 @@
 # youtube_utils.py
 
 import re
-from youtube_transcript_api import YouTubeTranscriptApi
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import os
+import json
+import threading
+from collections import OrderedDict
+from cache_utils import CACHE_DIR, get_embeddings
+from index_store import get_or_build_vectorstore, load_index, vectorstore_key
+from metrics_utils import span
 from langchain_core.documents import Document
 
+TRANSCRIPT_DIR = os.path.join(CACHE_DIR, "transcripts")
+WINDOW_SECONDS = 60
+WINDOW_MAX_CHARS = 1000
+WINDOW_OVERLAP_SECONDS = 10
+VIDEO_CACHE_MAX_ENTRIES = 16
+
+TIMESTAMP_PATTERN = re.compile(r"\[((?:\d+:)?\d{1,2}:\d{2})\]")
+
+# video_id -> index key for reloads within the same server process; the
+# index is loaded through index_store and the text read from the transcript cache
+_videos = OrderedDict()
+_videos_lock = threading.Lock()
+
+
 def extract_video_id(url: str) -> str:
     match = re.search(r"(?:v=|youtu\.be/|embed/)([\w-]{11})", url)
     return match.group(1) if match else None
 
-def fetch_yt_transcript(video_id: str) -> str:
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+def parse_timestamp(text: str) -> int:
+    seconds = 0
+    for part in text.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def video_link(video_id: str, seconds: float) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}&t={int(seconds)}s"
+
+def link_timestamps(answer: str, video_id: str) -> str:
+    # Turns [mm:ss] citations in an answer into markdown links that seek the video
+    return TIMESTAMP_PATTERN.sub(
+        lambda m: f"[[{m.group(1)}]]({video_link(video_id, parse_timestamp(m.group(1)))})", answer
+    )
+
+def fetch_yt_snippets(video_id: str):
+    # [{"text", "start", "duration"}], cached on disk per video
+    path = os.path.join(TRANSCRIPT_DIR, f"{video_id}.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    from youtube_transcript_api import YouTubeTranscriptApi
+
     api = YouTubeTranscriptApi()
     fetched = api.fetch(video_id)
-    return " ".join([snippet.text for snippet in fetched])
+    snippets = [{"text": s.text, "start": s.start, "duration": s.duration} for s in fetched]
+
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snippets, f)
+    os.replace(tmp, path)
+    return snippets
+
+def fetch_yt_transcript(video_id: str) -> str:
+    return " ".join(snippet["text"] for snippet in fetch_yt_snippets(video_id))
+
+def window_transcript(snippets, video_id: str, source: str, window_seconds: float = WINDOW_SECONDS,
+                      max_chars: int = WINDOW_MAX_CHARS, overlap_seconds: float = WINDOW_OVERLAP_SECONDS):
+    # Groups consecutive snippets into ~`window_seconds` chunks; the last
+    # `overlap_seconds` of a window are repeated at the start of the next.
+    # Each chunk starts with its [mm:ss] position so answers can cite it.
+    docs = []
+    i = 0
+    while i < len(snippets):
+        start = snippets[i]["start"]
+        j, chars = i, 0
+        while j < len(snippets) and (j == i or (snippets[j]["start"] - start < window_seconds and chars + len(snippets[j]["text"]) <= max_chars)):
+            chars += len(snippets[j]["text"]) + 1
+            j += 1
+        end = snippets[j - 1]["start"] + snippets[j - 1]["duration"]
+        text = " ".join(s["text"].replace("\n", " ") for s in snippets[i:j])
+        docs.append(Document(
+            page_content=f"[{format_timestamp(start)}] {text}",
+            metadata={
+                "source": source, "video_id": video_id, "start": start, "end": end,
+                "timestamp": format_timestamp(start), "url": video_link(video_id, start),
+            },
+        ))
+        if j >= len(snippets):
+            break
+        # Step back over the overlap, but always move forward
+        next_i = j
+        while next_i - 1 > i and snippets[j]["start"] - snippets[next_i - 1]["start"] < overlap_seconds:
+            next_i -= 1
+        i = next_i
+    return docs
 
 def process_youtube_video(url: str):
     video_id = extract_video_id(url)
     if not video_id:
         raise ValueError("Invalid YouTube URL")
 
-    full_text = fetch_yt_transcript(video_id)
-    docs = [Document(page_content=full_text)]
+    with span("load.youtube", video_id=video_id) as s:
+        with _videos_lock:
+            key = _videos.get(video_id)
+            if key is not None:
+                _videos.move_to_end(video_id)
+        vectorstore = load_index(key, get_embeddings()) if key is not None else None
+        if vectorstore is not None:
+            s.set(cached=True)
+            return vectorstore, _transcript_docs(url, video_id, fetch_yt_snippets(video_id))
+        s.set(cached=False, transcript_cached=os.path.exists(os.path.join(TRANSCRIPT_DIR, f"{video_id}.json")))
+        return _process_youtube_video(url, video_id)
+
+
+def _transcript_docs(url: str, video_id: str, snippets):
+    full_text = " ".join(snippet["text"] for snippet in snippets)
+    return [Document(page_content=full_text, metadata={"source": url, "video_id": video_id})]
+
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    texts = splitter.split_text(full_text)
+def _process_youtube_video(url: str, video_id: str):
+    snippets = fetch_yt_snippets(video_id)
+    if not snippets:
+        raise ValueError("This video has no transcript")
+    docs = _transcript_docs(url, video_id, snippets)
 
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    vectorstore = FAISS.from_texts(texts, embedding=embeddings)
+    # Keyed by chunk content, so a reload maps the stored index instead of re-embedding;
+    # the canonical URL keeps youtu.be and watch?v= links on the same index
+    source = f"https://www.youtube.com/watch?v={video_id}"
+    chunks = window_transcript(snippets, video_id, source=source)
+    embeddings = get_embeddings()
+    vectorstore = get_or_build_vectorstore(chunks, embeddings, source=source)
 
+    with _videos_lock:
+        _videos[video_id] = vectorstore_key(vectorstore)
+        while len(_videos) > VIDEO_CACHE_MAX_ENTRIES:
+            _videos.popitem(last=False)
     return vectorstore, docs